@@ -1,18 +1,34 @@
 import asyncio
-from typing import Union, Tuple, List
+import hmac
+import json
+from datetime import datetime
+from typing import Union, List, Optional
 
-from fastapi import APIRouter, WebSocket
+from fastapi import APIRouter, WebSocket, Query, HTTPException, Header
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
+from api.fleet import FleetManager
 from api.minecraft_server_versions import AvailableMinecraftServerVersions
 from api.server_manager import ServerManager
+from api.supervisor_client import SupervisorClient
+from api.worker_pool import start_worker_pool
+from config import get_config
 
 router = APIRouter(
     prefix="/api",
     responses={404: {"description": "Not found"}},
 )
 
-server_versions = AvailableMinecraftServerVersions()
+if get_config()["fleet"]["role"] == "coordinator":
+    # servers run on node agents, this app only places them and forwards calls
+    server_manager = FleetManager(get_config()["fleet"]["token"], get_config()["fleet"]["node_timeout"])
+elif get_config()["supervisor"]["enabled"]:
+    # all servers are owned by the supervisor process, this worker only forwards calls to it
+    server_manager = SupervisorClient(get_config()["supervisor"]["socket"])
+else:
+    start_worker_pool(get_config()["pool"]["workers"])
+    server_manager = ServerManager(AvailableMinecraftServerVersions())
 
 
 class AvailableVersionsResponse(BaseModel):
@@ -33,18 +49,23 @@ def get_available_versions():
     Get all supported minecraft server versions
     """
     return {
-        "versions": list(server_versions.available_versions.keys())
+        "versions": server_manager.get_available_versions()
     }
 
 
+@router.get("/jvm_profiles")
+def get_jvm_profiles():
+    """
+    Get all JVM profiles servers can be started with and their JVM flags
+    """
+    return server_manager.get_jvm_profiles()
+
+
 server_router = APIRouter(
     prefix="/api/servers",
     responses={404: {"description": "Not found"}},
 )
 
-server_manager = ServerManager(server_versions)
-
-
 class ServerCreationData(BaseModel):
     server_name: str = Field(..., title="Display name of the server")
     type: str = Field(..., title="Server type to install",
@@ -75,6 +96,8 @@ class ServerCreationResponse(BaseModel):
     id: int = Field(..., title="Unique server ID given by mc-server-manager",
                     description="A 4-digit server ID needed to communicate with this server instance through the API."
                                 "\n\nWill be 0 if the server couldn't be created.")
+    job_id: Union[int, None] = Field(None, title="ID of the install job of this server",
+                                     description="The install progress can be followed at /api/jobs/{job_id}.")
     message: str = Field(..., title="The message the server will respond with",
                          description="Will say something like 'Server created successfully!' if there was no error."
                                      "\n\nIf an error occurred, will say something like 'Server creation failed!'.")
@@ -86,6 +109,7 @@ class ServerCreationResponse(BaseModel):
         schema_extra = {
             "example": {
                 "id": 1234,
+                "job_id": 1,
                 "message": "Server created successfully!",
                 "error": ""
             }
@@ -134,6 +158,115 @@ class ServerActionResponse(BaseModel):
     message: str = Field(..., title="Message with information")
 
 
+class BatchActionItem(ServerActionData):
+    server: Union[int, str] = Field(..., title="The server(s) to run the action on",
+                                    description="A server ID, 'all' for every server or a status like 'running' "
+                                                "for every server with that status")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "server": "running",
+                "action": "kick",
+                "action_data": {
+                    "player": "Dummerle123"
+                }
+            }
+        }
+
+
+class BatchActionData(BaseModel):
+    actions: List[BatchActionItem] = Field(..., title="The actions to run")
+
+
+class BatchActionResult(ServerActionResponse):
+    server_id: int = Field(..., title="The server the action ran on")
+    action: str = Field(..., title="The action that ran")
+
+
+class BatchActionResponse(BaseModel):
+    results: List[BatchActionResult] = Field([], title="The result of every action",
+                                             description="One result per action and targeted server")
+
+
+class HibernationConfigData(BaseModel):
+    enabled: bool = Field(..., title="Whether the server hibernates",
+                          description="A hibernating server is stopped and started again as soon as a player tries "
+                                      "to join. It still shows up in the server list in the meantime.")
+    idle_minutes: int = Field(15, title="Minutes without online players before the server hibernates", ge=1)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "enabled": True,
+                "idle_minutes": 15
+            }
+        }
+
+
+class HardwareConfigData(BaseModel):
+    ram: int = Field(..., title="Heap size of the server in MB", ge=512)
+    jvm_profile: str = Field("default", title="JVM profile to start the server with",
+                             description="One of the profiles listed at /api/jvm_profiles")
+    cpu_cores: int = Field(0, title="Number of cpu cores to pin the server to",
+                           description="Only used if cpu placement is enabled. 0 gives the server a share of the "
+                                       "cores proportional to its share of the host's memory.", ge=0)
+    cpu_limit: float = Field(0, title="Number of cores the server may use at most",
+                             description="Enforced through the server's cgroup if the host supports cgroup v2. "
+                                         "0 for no limit.", ge=0)
+    memory_limit: int = Field(0, title="Memory the server may use at most in MB",
+                              description="Includes memory outside of the heap, so it must be larger than ram. "
+                                          "0 to derive it from ram.", ge=0)
+    io_bps: int = Field(0, title="Disk read and write limit in MB/s", description="0 for no limit.", ge=0)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "ram": 4096,
+                "jvm_profile": "aikar",
+                "cpu_cores": 2,
+                "cpu_limit": 2,
+                "memory_limit": 6144,
+                "io_bps": 100
+            }
+        }
+
+
+class BackupJobResponse(BaseModel):
+    type: str = Field(..., title="backup or restore")
+    backup_id: str = Field(..., title="ID of the backup that is taken or restored")
+    state: str = Field(..., title="One of [running, done, failed]")
+    error: Union[str, None] = Field(None, title="Why the job failed")
+    started_at: datetime = Field(..., title="When the job started")
+    finished_at: Union[datetime, None] = Field(None, title="When the job finished")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "type": "backup",
+                "backup_id": "20220126-120000",
+                "state": "running",
+                "error": None,
+                "started_at": "2022-01-26T12:00:00",
+                "finished_at": None
+            }
+        }
+
+
+class BackupResponse(BaseModel):
+    id: str = Field(..., title="ID of the backup")
+    created_at: datetime = Field(..., title="When the backup was taken")
+    world: str = Field(..., title="The world directory that was backed up")
+    size: int = Field(..., title="Uncompressed size of the world in bytes")
+    files_changed: int = Field(..., title="Number of files stored in this backup")
+    files_unchanged: int = Field(..., title="Number of files shared with the previous backup")
+
+
+class BackupsResponse(BaseModel):
+    backups: List[BackupResponse] = Field([], title="All backups of the server, newest first")
+    job: Union[BackupJobResponse, None] = Field(None, title="The last backup or restore job of the server")
+
+
 class ServerPlayersResponse(BaseModel):
     online: List = Field([], title="List of all players that are online",
                          description="A list of all players that are currently on the server")
@@ -143,21 +276,63 @@ class ServerPlayersResponse(BaseModel):
                      description="A list of all players that are currently op")
 
 
+class ServerMetricsResponse(BaseModel):
+    step: float = Field(..., title="Seconds between two data points")
+    timestamps: List[float] = Field([], title="Unix timestamp of the start of each data point")
+    cpu: List[Optional[float]] = Field([], title="Average cpu usage in percent of all cores")
+    memory: List[Optional[float]] = Field([], title="Average memory used by the server in bytes")
+    players: List[Optional[float]] = Field([], title="Average number of online players")
+    ping: List[Optional[float]] = Field([], title="Average ping in milliseconds")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "step": 60,
+                "timestamps": [1643200000, 1643200060],
+                "cpu": [12.5, 14.03],
+                "memory": [1073741824, 1073741824],
+                "players": [2, 3],
+                "ping": [1.2, None]
+            }
+        }
+
+
+class ServerLogsResponse(BaseModel):
+    from_line: int = Field(0, title="Number of the first returned line")
+    lines: List[str] = Field([], title="The console output lines")
+    next_line: int = Field(0, title="Number of the line after the last returned one",
+                           description="Pass as from_line to get the next page")
+    total_lines: int = Field(0, title="Number of lines the server has written in total")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "from_line": 1000,
+                "lines": ["[12:00:00] [Server thread/INFO]: Done (3.512s)! For help, type \"help\"\n"],
+                "next_line": 1001,
+                "total_lines": 1001
+            }
+        }
+
+
 @server_router.websocket("/api/servers/{server_id}/datastream")
-async def websocket_data_stream(websocket: WebSocket, server_id: int):
+async def websocket_data_stream(websocket: WebSocket, server_id: int, offset: Optional[int] = None):
+    """
+    Stream console output and resource usage of a running server.
+
+    Frames are pushed whenever there is new output or a new resource usage sample. Without an offset the whole
+    retained log is sent first, otherwise only lines from that offset on. Every frame contains the offset to
+    pass when reconnecting. Clients that don't keep up with sending are disconnected.
+    """
     await websocket.accept()
-    server = server_manager.get_server(server_id)
-    if server is not None:
-        server_pid = server.pid
-        if server_pid != 0:
-            stream = server_manager.process_handler.get_process(server_pid)
-            await websocket.send_json({"stdout": stream.logs, "full_log": True})
-            while True:
-                await asyncio.sleep(0.25)
-                try:
-                    await websocket.send_json(await stream.get_data())
-                except:
-                    break
+    frames = server_manager.subscribe(server_id=server_id, offset=offset)
+    try:
+        async for frame in frames:
+            await asyncio.wait_for(websocket.send_json(frame), get_config()["datastream"]["send_timeout"])
+    except:
+        pass
+    finally:
+        await frames.aclose()
 
 
 @server_router.post("/", response_model=ServerCreationResponse, responses={
@@ -170,13 +345,28 @@ def create_server(request: ServerCreationData):
     Create a new server with the given data
     """
     print(request)
-    id = server_manager.create_server(request.dict())
+    id, job_id = server_manager.create_server(data=request.dict())
     return {
         "id": id,
+        "job_id": job_id,
         "message": "Server created successfully!"
     }
 
 
+@server_router.post("/actions:batch", response_model=BatchActionResponse)
+def batch_action(data: BatchActionData):
+    """
+    Run several actions on one or more servers at once, all actions run concurrently
+    """
+    try:
+        results = server_manager.run_actions(items=[item.dict() for item in data.actions])
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return {
+        "results": results
+    }
+
+
 @server_router.get("/", response_model=AllServerStatusResponse)
 def get_server_data():
     return {
@@ -184,63 +374,314 @@ def get_server_data():
     }
 
 
+@server_router.get("/queue")
+def get_start_queue():
+    """
+    Get the servers waiting for memory or a free warm-up slot to start, and the ones still warming up.
+
+    In a fleet the queue of every node is returned, with node ids as keys.
+    """
+    return server_manager.get_start_queue()
+
+
 @server_router.get("/{server_id}", response_model=ServerStatusResponse)
 def get_server_status(server_id: int):
     """
     Get the status of the server with the given ID
     """
     return {
-        "data": server_manager.get_server_data(server_id)
+        "data": server_manager.get_server_data(server_id=server_id)
     }
 
 
 @server_router.post("/{server_id}/action", response_model=ServerActionResponse)
 def server_action(server_id: int, data: ServerActionData):
-    action = data.action
-    print(action)
-
-    def check_action_data(_action: str, _data: dict) -> Tuple[bool, str]:
-        action_with_data = {
-            "ban": ["player"],
-            "ban-ip": ["ip"],
-            "pardon": ["player"],
-            "pardon-ip": ["ip"],
-            "kick": ["player"],
-            "op": ["player"]
-        }
-        if _action not in action_with_data:
-            return True, ""
-        if _data is not None:
-            for key in action_with_data[_action]:
-                if key not in _data:
-                    return False, "Incorrect action_data to run this command"
-            return True, ""
-
-    action_data = data.action_data
-    success, message = check_action_data(action, action_data)
-    if success:
-        if action == "start":
-            success, message = server_manager.start_server(server_id)
-        elif action == "stop":
-            success, message = server_manager.stop_server(server_id)
-        elif action in ["ban", "pardon", "kick", "op", "deop"]:
-            success, message = server_manager.player_command(server_id, action_data["player"], action)
-        elif action in ["ban-ip", "pardon-ip"]:
-            success, message = server_manager.player_command(server_id, action_data["ip"], action)  # workaround for now
+    print(data.action)
+    success, message = server_manager.perform_action(server_id=server_id, action=data.action,
+                                                     action_data=data.action_data)
     return {
         "success": success,
         "message": message
     }
 
 
+@server_router.put("/{server_id}/hardware", response_model=HardwareConfigData)
+def set_hardware_config(server_id: int, data: HardwareConfigData):
+    """
+    Change the resources of the server, they are used from its next start on
+    """
+    try:
+        config = server_manager.set_hardware_config(server_id=server_id, ram=data.ram, jvm_profile=data.jvm_profile,
+                                                    cpu_cores=data.cpu_cores, cpu_limit=data.cpu_limit,
+                                                    memory_limit=data.memory_limit, io_bps=data.io_bps)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if config is None:
+        raise HTTPException(404, "Server not found")
+    return config
+
+
+@server_router.put("/{server_id}/hibernation", response_model=HibernationConfigData)
+def set_hibernation(server_id: int, data: HibernationConfigData):
+    """
+    Configure when the server is stopped for having no players online
+    """
+    config = server_manager.set_hibernation(server_id=server_id, enabled=data.enabled,
+                                            idle_minutes=data.idle_minutes)
+    if config is None:
+        raise HTTPException(404, "Server not found")
+    return config
+
+
+@server_router.post("/{server_id}/backups", response_model=BackupJobResponse)
+def create_backup(server_id: int):
+    """
+    Back up the server's world in the background.
+
+    Only files that changed since the last backup are stored again, a running server keeps running.
+    """
+    try:
+        job = server_manager.create_backup(server_id=server_id)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if job is None:
+        raise HTTPException(404, "Server not found")
+    return job
+
+
+@server_router.get("/{server_id}/backups", response_model=BackupsResponse)
+def get_backups(server_id: int):
+    """
+    Get all backups of the server and its last backup or restore job
+    """
+    backups = server_manager.get_backups(server_id=server_id)
+    if backups is None:
+        raise HTTPException(404, "Server not found")
+    return backups
+
+
+@server_router.post("/{server_id}/backups/{backup_id}/restore", response_model=BackupJobResponse)
+def restore_backup(server_id: int, backup_id: str):
+    """
+    Replace the world of the stopped server with a backup in the background, the server can't be started until
+    the restore finished
+    """
+    try:
+        job = server_manager.restore_backup(server_id=server_id, backup_id=backup_id)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if job is None:
+        raise HTTPException(404, "Server not found")
+    return job
+
+
+@server_router.get("/{server_id}/metrics", response_model=ServerMetricsResponse)
+def get_server_metrics(server_id: int, start: Optional[float] = Query(None, alias="from"),
+                       end: Optional[float] = Query(None, alias="to"), step: Optional[float] = None):
+    """
+    Get the resource usage and player history of the server with the given ID
+
+    Every value is a list with one entry per data point, missing data points are null.
+    """
+    metrics = server_manager.get_server_metrics(server_id=server_id, start=start, end=end, step=step)
+    if metrics is None:
+        raise HTTPException(404, "Server not found")
+    return metrics
+
+
+@server_router.get("/{server_id}/logs", response_model=ServerLogsResponse)
+def get_server_logs(server_id: int, from_line: Optional[int] = None, limit: int = Query(1000, gt=0, le=10000)):
+    """
+    Get console output of the server with the given ID, including earlier runs
+
+    Without from_line the last limit lines are returned.
+    """
+    logs = server_manager.get_server_logs(server_id=server_id, from_line=from_line, limit=limit)
+    if logs is None:
+        return {}
+    return logs
+
+
+@server_router.get("/{server_id}/logs/search", responses={
+    200: {
+        "description": "Matching lines, one JSON object per line",
+        "content": {"application/x-ndjson": {"example": '{"line": 1000, "text": "[12:00:00] [Server thread/INFO]: '
+                                                        'Dummerle123 joined the game"}'}}
+    },
+    400: {"description": "Invalid regular expression"}
+})
+def search_server_logs(server_id: int, q: str, regex: bool = False, since: Optional[float] = None,
+                       limit: int = Query(1000, gt=0, le=100000)):
+    """
+    Search the console history of the server with the given ID
+
+    q is searched as plain text unless regex is set. since is a unix timestamp, log segments that weren't
+    written to after it are skipped. The other segments are searched completely, so lines from before since can
+    still match. Matches are streamed in line order while the search is running.
+    """
+    try:
+        matches = server_manager.search_server_logs(server_id=server_id, query=q, regex=regex, since=since,
+                                                    limit=limit)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return StreamingResponse((json.dumps(match) + "\n" for match in matches), media_type="application/x-ndjson")
+
+
 @server_router.get("/{server_id}/players", response_model=ServerPlayersResponse)
 def get_players(server_id: int):
-    server = server_manager.get_server(server_id)
-    if server is not None:
-        return server.get_players()
+    players = server_manager.get_players(server_id=server_id)
+    if players is not None:
+        return players
     else:
         return {
             "online": [],
             "banned": [],
             "op": []
         }
+
+
+jar_router = APIRouter(
+    prefix="/api/jars",
+    responses={404: {"description": "Not found"}},
+)
+
+
+class JarPrewarmData(BaseModel):
+    versions: List[str] = Field(..., title="Minecraft versions to download into the jar store")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "versions": ["1.18.1", "1.17.1"]
+            }
+        }
+
+
+@jar_router.get("/")
+def get_jars():
+    """
+    Get all server jars in the jar store
+    """
+    return {
+        "jars": server_manager.get_jars()
+    }
+
+
+@jar_router.post("/prewarm")
+def prewarm_jars(request: JarPrewarmData):
+    """
+    Download the server jars of the given versions so installing them doesn't need to download anything
+    """
+    return {
+        "results": server_manager.prewarm_jars(versions=request.versions)
+    }
+
+
+@jar_router.post("/evict")
+def evict_jars():
+    """
+    Remove all server jars no server uses from the jar store
+    """
+    return {
+        "removed": server_manager.evict_unused_jars()
+    }
+
+
+job_router = APIRouter(
+    prefix="/api/jobs",
+    responses={404: {"description": "Not found"}},
+)
+
+
+class InstallJobResponse(BaseModel):
+    id: int = Field(..., title="ID of the install job")
+    server_id: int = Field(..., title="ID of the server that gets installed")
+    version: str = Field(..., title="Minecraft version that gets installed")
+    state: str = Field(..., title="State of the job",
+                       description="One of [queued, downloading, configuring, done, failed]")
+    error: Union[str, None] = Field(None, title="Why the job failed, empty if it didn't")
+    created_at: datetime = Field(..., title="When the job was queued")
+    finished_at: Union[datetime, None] = Field(None, title="When the job finished, empty if it is still running")
+    progress: dict = Field(..., title="Download progress",
+                           description="Bytes downloaded so far and the total size of the download if known")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "id": 1,
+                "server_id": 1234,
+                "version": "1.18.1",
+                "state": "downloading",
+                "error": None,
+                "created_at": "2022-01-26T12:00:00",
+                "finished_at": None,
+                "progress": {"downloaded": 10485760, "total": 46001032}
+            }
+        }
+
+
+class InstallJobsResponse(BaseModel):
+    jobs: List[InstallJobResponse] = Field([], title="All queued, running and recently finished install jobs")
+
+
+@job_router.get("/", response_model=InstallJobsResponse)
+def get_jobs():
+    """
+    Get all queued, running and recently finished install jobs
+    """
+    return {
+        "jobs": server_manager.get_jobs()
+    }
+
+
+@job_router.get("/{job_id}", response_model=InstallJobResponse, responses={404: {"description": "Job not found"}})
+def get_job(job_id: int):
+    """
+    Get the install job with the given ID
+    """
+    job = server_manager.get_job(job_id=job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return job
+
+
+node_router = APIRouter(
+    prefix="/api/nodes",
+    responses={404: {"description": "Not found"}},
+)
+
+
+class NodeRegistrationData(BaseModel):
+    node_id: str = Field(..., title="Unique name of the node")
+    host: str = Field(..., title="Host the node agent can be reached at")
+    port: int = Field(..., title="Port of the node agent")
+    capacity: dict = Field(..., title="Resources of the node",
+                           description="Memory, cpu and servers of the node as reported by the node agent")
+
+
+@node_router.post("/register")
+def register_node(request: NodeRegistrationData, authorization: Union[str, None] = Header(None)):
+    """
+    Register a node agent with the coordinator, node agents call this periodically as a heartbeat
+    """
+    if not isinstance(server_manager, FleetManager):
+        raise HTTPException(404, "Not a fleet coordinator")
+    token = get_config()["fleet"]["token"]
+    if not token or not hmac.compare_digest((authorization or "").encode(), f"Bearer {token}".encode()):
+        raise HTTPException(403, "Invalid token")
+    server_manager.register_node(request.node_id, request.host, request.port, request.capacity)
+    return {
+        "success": True
+    }
+
+
+@node_router.get("/")
+def get_nodes():
+    """
+    Get all node agents known to the coordinator
+    """
+    if not isinstance(server_manager, FleetManager):
+        raise HTTPException(404, "Not a fleet coordinator")
+    return {
+        "nodes": server_manager.get_nodes()
+    }
@@ -0,0 +1,81 @@
+import asyncio
+import subprocess
+from typing import List
+
+import psutil
+
+from api.process_handler import ProcessHandler, ProcessOutputMixin
+
+
+class AsyncServerProcess(ProcessOutputMixin, psutil.Process):
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        super().__init__(process.pid)
+        self._init_output()
+        self.process = process
+
+    def poll(self):
+        return self.process.returncode
+
+
+class AsyncProcessHandler(ProcessHandler):
+    """
+    Process backend that runs all servers on a single event loop.
+
+    Output reading, stdin writes and exit detection of every server happen on one loop thread instead of a
+    thread per server. The public API is the same as ProcessHandler's, so it can be called from any thread.
+    """
+    line_limit = 1024 * 1024
+
+    def __init__(self):
+        super().__init__()
+        self.loop = asyncio.new_event_loop()
+
+    def start_process(self, command: List[str], cwd: str):
+        future = asyncio.run_coroutine_threadsafe(self._start_process(command, cwd), self.loop)
+        return future.result()
+
+    async def _start_process(self, command: List[str], cwd: str):
+        proc = await asyncio.create_subprocess_exec(*command, cwd=cwd,
+                                                    stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                                    stderr=subprocess.STDOUT, limit=self.line_limit)
+        process = AsyncServerProcess(proc)
+        self.processes[proc.pid] = process
+        self.threads[proc.pid] = self.loop.create_task(self._read_output(process))
+        return proc.pid
+
+    async def _read_output(self, process: AsyncServerProcess):
+        try:
+            while True:
+                try:
+                    output = await process.process.stdout.readline()
+                except ValueError:
+                    # line longer than line_limit, drop what was buffered so far
+                    continue
+                if not output:
+                    break
+                process.handle_output(output.decode(errors="replace"))
+            process.handle_exit(await process.process.wait())
+        finally:
+            process.hub.close()
+            self.processes.pop(process.pid, None)
+            self.threads.pop(process.pid, None)
+
+    def send_input(self, pid: int, message: str):
+        process = self.get_process(pid)
+        if process is not None:
+            self.loop.call_soon_threadsafe(self._write_input, process, message)
+
+    @staticmethod
+    def _write_input(process: AsyncServerProcess, message: str):
+        if not process.process.stdin.is_closing():
+            process.process.stdin.write(message.encode())
+
+    async def _monitor(self):
+        while not self.stop:
+            delay = await self.loop.run_in_executor(None, self.sampler.sample, dict(self.processes))
+            await asyncio.sleep(min(max(delay, 0.05), self.sampler.interval))
+
+    def run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._monitor())
@@ -0,0 +1,344 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime
+from threading import Lock
+from typing import Optional, Tuple, List, Dict
+
+CHUNK_SIZE = 1024 * 1024
+BACKUP_ID_FORMAT = "%Y%m%d-%H%M%S"
+
+
+def _parse_backup_id(backup_id: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(backup_id, BACKUP_ID_FORMAT)
+    except ValueError:
+        return None
+
+
+def store_file(source: str, target: str, previous_sha: Optional[str], compress_level: int) -> Tuple[str, bool]:
+    """
+    Hash and gzip a file in one pass, runs in a worker process
+    :param source: the file to back up
+    :param target: where the compressed file goes
+    :param previous_sha: hash of the file in the previous snapshot, nothing is written if it didn't change
+    :param compress_level: gzip compression level
+    :return: the file's sha256 and whether target was written
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    sha = hashlib.sha256()
+    tmp_target = f"{target}.tmp"
+    with open(source, "rb") as src, gzip.open(tmp_target, "wb", compress_level) as dst:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sha.update(chunk)
+            dst.write(chunk)
+    digest = sha.hexdigest()
+    if digest == previous_sha:
+        # only the mtime changed
+        os.remove(tmp_target)
+        return digest, False
+    os.replace(tmp_target, target)
+    return digest, True
+
+
+def restore_file(source: str, target: str, mtime_ns: int):
+    """
+    Decompress a file of a snapshot, runs in a worker process
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with gzip.open(source, "rb") as src, open(target, "wb") as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    # keeps the file unchanged for the next backup
+    os.utime(target, ns=(mtime_ns, mtime_ns))
+
+
+class BackupManager:
+    """
+    Incremental, deduplicating world backups.
+
+    Every snapshot is a directory with a manifest and a gzipped copy of each world file. Files whose size and
+    mtime match the previous snapshot, or whose content hash does, are hardlinked from it instead of being
+    stored again, so a snapshot only takes the space of the region files that changed. Changed files are
+    hashed and compressed in parallel in a process pool. Snapshots are kept according to keep_last, keep_daily
+    and keep_weekly, and deleting one never affects the others.
+
+    Running servers stop autosaving and flush the world to disk before the snapshot is taken, and resume
+    autosaving after it, see MinecraftServer.flush_world.
+    """
+
+    def __init__(self, executor: ProcessPoolExecutor, path: str, compress_level: int = 6, keep_last: int = 10,
+                 keep_daily: int = 7, keep_weekly: int = 4, save_timeout: float = 60):
+        self.executor = executor
+        self.path = path
+        self.compress_level = compress_level
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+        self.save_timeout = save_timeout
+        self._jobs: Dict[int, dict] = {}
+        self._runner = ThreadPoolExecutor(2, thread_name_prefix="backup")
+        self._lock = Lock()
+        # held while a server start, a backup or a restore is admitted, so the server can't start while its
+        # world is copied or replaced
+        self.start_lock = Lock()
+
+    def _server_path(self, server_id: int) -> str:
+        return os.path.join(self.path, str(server_id))
+
+    @staticmethod
+    def _world_name(server: "MinecraftServer") -> str:
+        # all dimensions are below the top directory of level-name, e.g. world/world and world/world_nether
+        level_name = server.server_properties.get("level-name", "world")
+        return level_name.replace("\\", "/").split("/")[0]
+
+    def is_busy(self, server_id: int) -> bool:
+        with self._lock:
+            job = self._jobs.get(server_id)
+            return job is not None and job["state"] == "running"
+
+    def get_job(self, server_id: int) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(server_id)
+            return dict(job) if job is not None else None
+
+    def _start_job(self, server_id: int, job_type: str, backup_id: str, task, *args) -> dict:
+        with self._lock:
+            job = self._jobs.get(server_id)
+            if job is not None and job["state"] == "running":
+                raise ValueError(f"A {job['type']} of this server is already running")
+            job = {
+                "type": job_type,
+                "backup_id": backup_id,
+                "state": "running",
+                "error": None,
+                "started_at": datetime.now(),
+                "finished_at": None
+            }
+            self._jobs[server_id] = job
+        self._runner.submit(self._run_job, job, task, *args)
+        return dict(job)
+
+    def _run_job(self, job: dict, task, *args):
+        try:
+            task(*args)
+            job["state"] = "done"
+        except Exception as e:
+            print(f"{job['type'].capitalize()} {job['backup_id']} failed: {e}")
+            job["error"] = str(e)
+            job["state"] = "failed"
+        job["finished_at"] = datetime.now()
+
+    def start_backup(self, server: "MinecraftServer") -> dict:
+        """
+        Take a snapshot of the server's world in the background
+        :return: the backup job
+        """
+        backup_id = datetime.now().strftime(BACKUP_ID_FORMAT)
+        if os.path.isdir(os.path.join(self._server_path(server.id), backup_id)):
+            raise ValueError("A backup was taken less than a second ago")
+        with self.start_lock:
+            if server.get_status() not in ("stopped", "hibernating", "running"):
+                raise ValueError(f"Can't back up a server that is {server.get_status()}")
+            return self._start_job(server.id, "backup", backup_id, self._backup, server, backup_id)
+
+    def _backup(self, server: "MinecraftServer", backup_id: str):
+        server_path = self._server_path(server.id)
+        world = self._world_name(server)
+        previous = self._latest_manifest(server.id)
+        previous_files = previous["files"] if previous is not None and previous["world"] == world else {}
+        tmp_path = os.path.join(server_path, f"{backup_id}.tmp")
+        if os.path.isdir(server_path):
+            for name in os.listdir(server_path):
+                if name.endswith(".tmp"):
+                    # left behind by a backup that was interrupted
+                    shutil.rmtree(os.path.join(server_path, name), ignore_errors=True)
+        flushed = server.get_status() == "running"
+        if flushed and not server.flush_world(self.save_timeout):
+            server.resume_saving()
+            raise RuntimeError("The server didn't save the world in time")
+        files = {}
+        futures = {}
+        try:
+            world_path = os.path.join(server.path_data.base_path, world)
+            for root, _, names in os.walk(world_path):
+                for name in names:
+                    if name == "session.lock":
+                        continue
+                    source = os.path.join(root, name)
+                    relative_path = os.path.relpath(source, server.path_data.base_path).replace(os.sep, "/")
+                    stat = os.stat(source)
+                    entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": None}
+                    files[relative_path] = entry
+                    old = previous_files.get(relative_path)
+                    if old is not None and old["size"] == entry["size"] and old["mtime_ns"] == entry["mtime_ns"]:
+                        entry["sha256"] = old["sha256"]
+                        self._link(previous["id"], tmp_path, server.id, relative_path)
+                        continue
+                    futures[relative_path] = self.executor.submit(
+                        store_file, source, self._stored_path(tmp_path, relative_path),
+                        old["sha256"] if old is not None else None, self.compress_level)
+            changed = 0
+            for relative_path, future in futures.items():
+                sha, written = future.result()
+                files[relative_path]["sha256"] = sha
+                if written:
+                    changed += 1
+                else:
+                    self._link(previous["id"], tmp_path, server.id, relative_path)
+        except Exception:
+            for future in futures.values():
+                future.cancel()
+            wait(futures.values())
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        finally:
+            if flushed:
+                server.resume_saving()
+        manifest = {
+            "id": backup_id,
+            "created_at": datetime.now().isoformat(),
+            "world": world,
+            "size": sum(entry["size"] for entry in files.values()),
+            "files_changed": changed,
+            "files_unchanged": len(files) - changed,
+            "files": files
+        }
+        os.makedirs(tmp_path, exist_ok=True)
+        with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(server_path, backup_id))
+        print(f"Backup {backup_id} of server {server.id} done, {changed} of {len(files)} files changed")
+        self._apply_retention(server.id)
+
+    @staticmethod
+    def _stored_path(snapshot_path: str, relative_path: str) -> str:
+        return os.path.join(snapshot_path, "files", f"{relative_path}.gz")
+
+    def _link(self, previous_id: str, snapshot_path: str, server_id: int, relative_path: str):
+        source = self._stored_path(os.path.join(self._server_path(server_id), previous_id), relative_path)
+        target = self._stored_path(snapshot_path, relative_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.link(source, target)
+
+    def _read_manifest(self, server_id: int, backup_id: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self._server_path(server_id), backup_id, "manifest.json"), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _backup_ids(self, server_id: int) -> List[str]:
+        """
+        Ids of all finished snapshots, newest first. Unfinished snapshots end with .tmp, they and anything else
+        that isn't named like a snapshot are left out.
+        """
+        try:
+            names = os.listdir(self._server_path(server_id))
+        except OSError:
+            return []
+        return sorted((name for name in names if _parse_backup_id(name) is not None), reverse=True)
+
+    def _latest_manifest(self, server_id: int) -> Optional[dict]:
+        for backup_id in self._backup_ids(server_id):
+            manifest = self._read_manifest(server_id, backup_id)
+            if manifest is not None:
+                return manifest
+        return None
+
+    def get_backups(self, server_id: int) -> List[dict]:
+        """
+        Get all snapshots of a server without their file lists, newest first
+        """
+        backups = []
+        for backup_id in self._backup_ids(server_id):
+            manifest = self._read_manifest(server_id, backup_id)
+            if manifest is not None:
+                del manifest["files"]
+                backups.append(manifest)
+        return backups
+
+    def _apply_retention(self, server_id: int):
+        keep = set()
+        days = []
+        weeks = []
+        for backup_id in self._backup_ids(server_id):
+            created_at = _parse_backup_id(backup_id)
+            if len(keep) < self.keep_last:
+                keep.add(backup_id)
+            day = created_at.date()
+            if day not in days and len(days) < self.keep_daily:
+                days.append(day)
+                keep.add(backup_id)
+            week = created_at.isocalendar()[:2]
+            if week not in weeks and len(weeks) < self.keep_weekly:
+                weeks.append(week)
+                keep.add(backup_id)
+        for backup_id in self._backup_ids(server_id):
+            if backup_id not in keep:
+                shutil.rmtree(os.path.join(self._server_path(server_id), backup_id))
+
+    def start_restore(self, server: "MinecraftServer", backup_id: str) -> dict:
+        """
+        Replace the server's world with a snapshot in the background
+        :return: the restore job
+        """
+        manifest = None
+        if backup_id in self._backup_ids(server.id):
+            manifest = self._read_manifest(server.id, backup_id)
+        if manifest is None:
+            raise ValueError(f"Backup {backup_id} does not exist")
+        with self.start_lock:
+            if server.get_status() not in ("stopped", "hibernating"):
+                raise ValueError("The server has to be stopped to restore a backup")
+            return self._start_job(server.id, "restore", backup_id, self._restore, server, manifest)
+
+    def _restore(self, server: "MinecraftServer", manifest: dict):
+        snapshot_path = os.path.join(self._server_path(server.id), manifest["id"])
+        world_path = os.path.join(server.path_data.base_path, manifest["world"])
+        restore_path = f"{world_path}.restoring"
+        shutil.rmtree(restore_path, ignore_errors=True)
+        futures = []
+        for relative_path, entry in manifest["files"].items():
+            # relative paths start with the world directory
+            target = os.path.join(restore_path, *relative_path.split("/")[1:])
+            futures.append(self.executor.submit(restore_file, self._stored_path(snapshot_path, relative_path),
+                                                target, entry["mtime_ns"]))
+        try:
+            for future in futures:
+                future.result()
+        except Exception:
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            shutil.rmtree(restore_path, ignore_errors=True)
+            raise
+        os.makedirs(restore_path, exist_ok=True)
+        replaced_path = f"{world_path}.replaced"
+        # left behind by a restore that was interrupted, os.replace can't replace a directory that isn't empty
+        shutil.rmtree(replaced_path, ignore_errors=True)
+        replaced = os.path.isdir(world_path)
+        if replaced:
+            os.replace(world_path, replaced_path)
+        try:
+            os.replace(restore_path, world_path)
+        except OSError:
+            if replaced:
+                os.replace(replaced_path, world_path)
+            shutil.rmtree(restore_path, ignore_errors=True)
+            raise
+        shutil.rmtree(replaced_path, ignore_errors=True)
+        print(f"Restored backup {manifest['id']} of server {server.id}")
+
+    def remove_server(self, server_id: int):
+        """
+        Delete all snapshots of a server
+        """
+        shutil.rmtree(self._server_path(server_id), ignore_errors=True)
+        with self._lock:
+            self._jobs.pop(server_id, None)
@@ -0,0 +1,168 @@
+import os
+import time
+from typing import Optional, Tuple
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+CONTROLLERS = ("cpu", "memory", "io")
+# cpu.max period in microseconds
+CPU_PERIOD = 100000
+
+
+def _read(path: str) -> str:
+    with open(path, "r") as f:
+        return f.read()
+
+
+def _write(path: str, value: str):
+    with open(path, "w") as f:
+        f.write(value)
+
+
+def block_device(path: str) -> Optional[str]:
+    """
+    Get "major:minor" of the disk path is on, io.max only accepts whole disks and not their partitions
+    """
+    device = os.stat(path).st_dev
+    device_id = f"{os.major(device)}:{os.minor(device)}"
+    sys_path = os.path.realpath(f"/sys/dev/block/{device_id}")
+    if not os.path.isdir(sys_path):
+        # not a block device, e.g. tmpfs or overlayfs
+        return None
+    if os.path.isfile(os.path.join(sys_path, "partition")):
+        sys_path = os.path.dirname(sys_path)
+    try:
+        return _read(os.path.join(sys_path, "dev")).strip()
+    except OSError:
+        return None
+
+
+class Cgroup:
+    """
+    The cgroup of one server. Usage is read from the cgroup's files, which covers all its processes.
+    """
+
+    def __init__(self, path: str, num_cpus: int):
+        self.path = path
+        self.num_cpus = num_cpus
+        self._last_usage: Optional[Tuple[float, int]] = None
+
+    def set_limits(self, cpu_limit: float = 0, memory_limit: int = 0, io_device: Optional[str] = None,
+                   io_bps: int = 0):
+        """
+        :param cpu_limit: number of cores the server may use, 0 for no limit
+        :param memory_limit: memory limit in MB, 0 for no limit
+        :param io_device: "major:minor" of the disk to limit io on
+        :param io_bps: read and write limit on io_device in MB/s, 0 for no limit
+        """
+        if cpu_limit > 0:
+            self._write_limit("cpu.max", f"{int(cpu_limit * CPU_PERIOD)} {CPU_PERIOD}")
+        else:
+            self._write_limit("cpu.max", f"max {CPU_PERIOD}")
+        self._write_limit("memory.max", str(memory_limit * 1024 * 1024) if memory_limit > 0 else "max")
+        if io_device is not None:
+            limit = str(io_bps * 1024 * 1024) if io_bps > 0 else "max"
+            self._write_limit("io.max", f"{io_device} rbps={limit} wbps={limit}")
+
+    def _write_limit(self, file: str, value: str):
+        path = os.path.join(self.path, file)
+        # the file is missing if its controller isn't available, CgroupManager.setup warned about that already
+        if os.path.isfile(path):
+            _write(path, value)
+
+    def add_process(self, pid: int):
+        """
+        Move a process and all its threads into this cgroup, processes it starts later are in it too
+        """
+        _write(os.path.join(self.path, "cgroup.procs"), str(pid))
+
+    def sample(self) -> Tuple[float, int]:
+        """
+        Read the cpu and memory usage of all processes in the cgroup
+        :return: cpu usage in percent of all cores since the last call and memory usage in bytes
+        """
+        usage = 0
+        for line in _read(os.path.join(self.path, "cpu.stat")).splitlines():
+            key, value = line.split()
+            if key == "usage_usec":
+                usage = int(value)
+                break
+        memory = int(_read(os.path.join(self.path, "memory.current")))
+        now = time.monotonic()
+        cpu_percent = 0
+        if self._last_usage is not None:
+            last_time, last_usage = self._last_usage
+            if now > last_time:
+                cpu_percent = (usage - last_usage) / ((now - last_time) * 1000000 * self.num_cpus) * 100
+        self._last_usage = (now, usage)
+        return cpu_percent, memory
+
+    def remove(self):
+        """
+        Remove the cgroup, only possible once all its processes exited
+        """
+        try:
+            os.rmdir(self.path)
+        except OSError as e:
+            print(f"Couldn't remove cgroup {self.path}: {e}")
+
+
+class CgroupManager:
+    """
+    Runs every server in its own cgroup v2 below path, so cpu, memory and io limits from the server's hardware
+    config are enforced by the kernel for the server and every process it starts.
+
+    Needs a cgroup v2 hierarchy with write access to path, e.g. as root or in a delegated systemd slice. The
+    cpu, memory and io controllers are enabled for the servers' cgroups, so path must not contain processes
+    itself. Servers without a memory limit get their heap plus memory_overhead (a fraction of the heap), but at
+    least min_overhead MB, as limit. The JVM needs memory outside of the heap too, small heaps relatively more.
+    """
+
+    def __init__(self, path: str, num_cpus: int, memory_overhead: float = 0.5, min_overhead: int = 512):
+        self.path = path
+        self.num_cpus = num_cpus
+        self.memory_overhead = memory_overhead
+        self.min_overhead = min_overhead
+
+    @staticmethod
+    def is_supported() -> bool:
+        return os.path.isfile(os.path.join(CGROUP_ROOT, "cgroup.controllers"))
+
+    def setup(self) -> bool:
+        """
+        Create path and enable the controllers for its children
+        :return: whether cgroups can be used
+        """
+        if not self.is_supported():
+            print("cgroup v2 is not available, resource limits are disabled")
+            return False
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            available = _read(os.path.join(self.path, "cgroup.controllers")).split()
+            missing = [controller for controller in CONTROLLERS if controller not in available]
+            if missing:
+                print(f"cgroup controllers {missing} are not available in {self.path}")
+            enable = " ".join(f"+{controller}" for controller in CONTROLLERS if controller in available)
+            _write(os.path.join(self.path, "cgroup.subtree_control"), enable)
+        except OSError as e:
+            print(f"Can't use cgroups at {self.path}, resource limits are disabled: {e}")
+            return False
+        return True
+
+    def create(self, server: "MinecraftServer", pid: int) -> Cgroup:
+        """
+        Create the cgroup of a server with the limits of its hardware config and move its process into it,
+        raises OSError if that failed
+        """
+        config = server.hardware_config
+        cgroup = Cgroup(os.path.join(self.path, f"server-{server.id}"), self.num_cpus)
+        os.makedirs(cgroup.path, exist_ok=True)
+        memory_limit = config.memory_limit or config.ram + max(int(config.ram * self.memory_overhead),
+                                                               self.min_overhead)
+        try:
+            io_device = block_device(server.path_data.base_path)
+            cgroup.set_limits(config.cpu_limit, memory_limit, io_device, config.io_bps)
+            cgroup.add_process(pid)
+        except OSError:
+            cgroup.remove()
+            raise
+        return cgroup
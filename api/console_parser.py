@@ -0,0 +1,61 @@
+import re
+from dataclasses import dataclass, field
+from typing import Optional, List, Tuple, Pattern
+
+EXITED = "exited"
+
+# the prefix of lines the server itself logs, e.g. "[12:00:00] [Server thread/INFO]: " or, on Paper,
+# "[12:00:00 INFO]: ". Chat is logged as "<player> message" after it, so messages are matched as a whole and a
+# player can't fake an event by typing its text.
+PREFIX = r"\[[\d:]+(\] \[(Server thread|main)/| )(INFO|WARN|ERROR|FATAL)\]: "
+
+
+def _message(pattern: str) -> Pattern:
+    return re.compile(PREFIX + f"(?:{pattern})")
+
+
+# event type -> pattern of the whole line, checked in order, the first match wins. Named groups end up in the
+# event's data.
+PATTERNS: List[Tuple[str, Pattern]] = [
+    ("player_join", _message(r"(?P<player>\w{1,16}) joined the game")),
+    ("player_leave", _message(r"(?P<player>\w{1,16}) left the game")),
+    ("cant_keep_up", _message(r"Can't keep up! .*Running (?P<ms_behind>\d+)ms or (?P<ticks_behind>\d+) ticks behind")),
+    ("done", _message(r"Done \((?P<startup_time>[\d.,]+)s\)! For help, type \"help\"( or \"\?\")?")),
+    ("starting", _message(r"Starting minecraft server version (?P<version>\S+)")),
+    ("stopping", _message(r"Stopping (the )?server")),
+    ("saved", _message(r"Saved the game")),
+    ("crash", _message(r"This crash report has been saved to: (?P<report>.+)|"
+                       r"Encountered an unexpected exception|Exception stopping the server|"
+                       r"Failed to start the minecraft server")),
+]
+
+
+@dataclass
+class ConsoleEvent:
+    type: str
+    line: str = ""
+    data: dict = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return {
+            "type": self.type,
+            **self.data
+        }
+
+
+class ConsoleParser:
+    """
+    Classifies console output lines, every line is looked at once when it arrives
+    """
+
+    def __init__(self, patterns: List[Tuple[str, Pattern]] = None):
+        self.patterns = PATTERNS if patterns is None else patterns
+
+    def parse(self, line: str) -> Optional[ConsoleEvent]:
+        line = line.rstrip()
+        for event_type, pattern in self.patterns:
+            match = pattern.fullmatch(line)
+            if match is not None:
+                data = {key: value for key, value in match.groupdict().items() if value is not None}
+                return ConsoleEvent(event_type, line, data)
+        return None
@@ -0,0 +1,77 @@
+import os
+from threading import Lock
+from typing import Dict, List
+
+import psutil
+
+
+class CpuPlacer:
+    """
+    Pins every server to its own set of cpu cores so busy servers don't cause tick spikes on their neighbours.
+
+    Cores are handed out to servers as they start, preferring cores no other server is pinned to and the least
+    busy ones among those. Servers only share cores once every core is taken. A server without a fixed number
+    of cores gets a share of the cores proportional to its share of the host's memory.
+    """
+
+    def __init__(self):
+        self._cpus = sorted(psutil.Process().cpu_affinity())
+        self._assigned: Dict[int, List[int]] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def is_supported() -> bool:
+        # cpu affinity is only available on Linux, Windows and FreeBSD
+        return hasattr(psutil.Process, "cpu_affinity")
+
+    def place(self, server_id: int, cores: int, ram: int) -> List[int]:
+        """
+        Pick the cores a server gets pinned to
+        :param server_id: the server that starts
+        :param cores: number of cores, 0 to derive it from ram
+        :param ram: the server's heap in MB
+        :return: the cores
+        """
+        if cores <= 0:
+            share = ram * 1024 * 1024 / psutil.virtual_memory().total
+            cores = max(round(len(self._cpus) * share), 1)
+        cores = min(cores, len(self._cpus))
+        load = psutil.cpu_percent(percpu=True)
+        with self._lock:
+            self._assigned.pop(server_id, None)
+            servers_per_cpu = {cpu: 0 for cpu in self._cpus}
+            for assigned in self._assigned.values():
+                for cpu in assigned:
+                    servers_per_cpu[cpu] += 1
+            ranked = sorted(self._cpus, key=lambda cpu: (servers_per_cpu[cpu],
+                                                         load[cpu] if cpu < len(load) else 0))
+            placement = sorted(ranked[:cores])
+            if servers_per_cpu[ranked[cores - 1]]:
+                print(f"Not enough free cores for server {server_id}, sharing cores {placement}")
+            self._assigned[server_id] = placement
+        return placement
+
+    def release(self, server_id: int):
+        with self._lock:
+            self._assigned.pop(server_id, None)
+
+    @staticmethod
+    def pin(pid: int, cpus: List[int]):
+        """
+        Set the affinity of a process and all its threads. Threads the JVM creates later inherit it.
+        """
+        process = psutil.Process(pid)
+        process.cpu_affinity(cpus)
+        if not hasattr(os, "sched_setaffinity"):
+            return
+        # psutil.Process doesn't accept thread ids
+        for thread in process.threads():
+            try:
+                os.sched_setaffinity(thread.id, cpus)
+            except OSError:
+                # the thread exited in the meantime
+                pass
+
+    def get_placements(self) -> Dict[int, List[int]]:
+        with self._lock:
+            return dict(self._assigned)
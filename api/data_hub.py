@@ -0,0 +1,152 @@
+import asyncio
+import threading
+from collections import deque
+from typing import Optional, Set
+
+from api.log_buffer import LogBuffer
+
+
+class Subscription:
+    """
+    A single consumer of a DataHub.
+
+    Every subscription has its own cursor into the log buffer, so consumers never take lines from each other.
+    Metrics are coalesced to the latest sample and discrete events are kept in a bounded queue; a consumer
+    that falls behind loses the oldest entries instead of slowing down the producer.
+    """
+
+    def __init__(self, hub: "DataHub", loop: asyncio.AbstractEventLoop, offset: Optional[int], max_events: int):
+        self.hub = hub
+        self.offset = hub.logs.first_offset if offset is None else offset
+        self.full_log = offset is None
+        self.dropped_events = 0
+        self.closed = False
+        self._loop = loop
+        self._event = asyncio.Event()
+        self._woken = False
+        self._events = deque(maxlen=max_events)
+        self._wake()
+
+    def _wake(self):
+        # may be called from any thread, only schedule one wake up per frame
+        if not self._woken:
+            self._woken = True
+            try:
+                self._loop.call_soon_threadsafe(self._event.set)
+            except RuntimeError:
+                # event loop is already closed
+                self.closed = True
+
+    def _push_event(self, event: dict):
+        if len(self._events) == self._events.maxlen:
+            self.dropped_events += 1
+        self._events.append(event)
+        self._wake()
+
+    async def next_frame(self) -> Optional[dict]:
+        """
+        Wait for new output, metrics or events
+        :return: the next frame to send or None if the hub was closed and everything was consumed
+        """
+        while True:
+            if not self.closed:
+                await self._event.wait()
+            self._event.clear()
+            self._woken = False
+            frame = self._collect()
+            if frame is not None or self.closed:
+                return frame
+
+    def _collect(self) -> Optional[dict]:
+        logs = self.hub.logs
+        first_offset = logs.first_offset
+        stdout, next_offset = logs.read_since(self.offset)
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+        metrics_changed = self.hub.metrics_changed(self)
+        if not stdout and not events and not self.full_log and not metrics_changed:
+            return None
+        frame = dict(self.hub.metrics)
+        frame["stdout"] = stdout
+        frame["offset"] = next_offset
+        frame["full_log"] = self.full_log
+        if self.offset < first_offset:
+            frame["skipped_lines"] = first_offset - self.offset
+        if events:
+            frame["events"] = events
+        if self.dropped_events:
+            frame["dropped_events"] = self.dropped_events
+            self.dropped_events = 0
+        self.offset = next_offset
+        self.full_log = False
+        return frame
+
+
+class DataHub:
+    """
+    Fans console output, resource usage and events of one server process out to any number of subscribers
+    """
+
+    def __init__(self, logs: LogBuffer, max_events: int = 100):
+        self.logs = logs
+        self.max_events = max_events
+        self.metrics = {}
+        self._metrics_version = 0
+        self._seen_versions = {}
+        self._subscriptions: Set[Subscription] = set()
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def subscribe(self, offset: Optional[int] = None) -> Subscription:
+        """
+        Subscribe from within the running event loop
+        :param offset: line offset to start streaming output from, None streams the whole retained log
+        :return:
+        """
+        subscription = Subscription(self, asyncio.get_running_loop(), offset, self.max_events)
+        with self._lock:
+            if self.closed:
+                subscription.closed = True
+            else:
+                self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+            self._seen_versions.pop(id(subscription), None)
+
+    def metrics_changed(self, subscription: Subscription) -> bool:
+        with self._lock:
+            changed = self._seen_versions.get(id(subscription)) != self._metrics_version
+            self._seen_versions[id(subscription)] = self._metrics_version
+        return changed
+
+    def publish_output(self):
+        for subscription in self._get_subscriptions():
+            subscription._wake()
+
+    def publish_metrics(self, metrics: dict):
+        with self._lock:
+            self.metrics = metrics
+            self._metrics_version += 1
+        for subscription in self._get_subscriptions():
+            subscription._wake()
+
+    def publish_event(self, event: dict):
+        for subscription in self._get_subscriptions():
+            subscription._push_event(event)
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            subscriptions = list(self._subscriptions)
+            self._subscriptions.clear()
+        for subscription in subscriptions:
+            subscription.closed = True
+            subscription._wake()
+
+    def _get_subscriptions(self):
+        with self._lock:
+            return list(self._subscriptions)
@@ -0,0 +1,62 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux i686; rv:96.0) Gecko/20100101 Firefox/96.0"
+}
+
+
+@dataclass
+class DownloadProgress:
+    downloaded: int = 0
+    total: Optional[int] = None
+
+
+def download_file(url: str, destination: str, progress: Optional[DownloadProgress] = None,
+                  chunk_size: int = 256 * 1024, retries: int = 3, timeout: float = 30):
+    """
+    Stream url to destination without holding the file in memory.
+
+    Data is written to destination.part first and renamed once complete. If the download gets interrupted,
+    the partial file is resumed with an HTTP Range request, also across calls.
+    :param url: the url to download
+    :param destination: path the complete file will be saved at
+    :param progress: updated with the number of bytes downloaded so far and the total size if known
+    :param chunk_size: bytes to read and write at once
+    :param retries: how often to resume after a connection error
+    :param timeout: socket timeout in seconds
+    """
+    progress = progress if progress is not None else DownloadProgress()
+    part_file = f"{destination}.part"
+    attempt = 0
+    while True:
+        offset = os.path.getsize(part_file) if os.path.isfile(part_file) else 0
+        headers = dict(HEADERS)
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 416:
+                    # the part file is already complete
+                    break
+                response.raise_for_status()
+                if response.status_code != 206:
+                    offset = 0
+                length = response.headers.get("Content-Length")
+                progress.total = offset + int(length) if length is not None else None
+                progress.downloaded = offset
+                with open(part_file, "ab" if offset else "wb") as f:
+                    for chunk in response.iter_content(chunk_size):
+                        f.write(chunk)
+                        progress.downloaded += len(chunk)
+            if progress.total is None or progress.downloaded >= progress.total:
+                break
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            pass
+        attempt += 1
+        if attempt > retries:
+            raise IOError(f"Download of {url} failed after {retries} retries")
+    os.replace(part_file, destination)
@@ -0,0 +1,297 @@
+import itertools
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Dict, Optional, List, Tuple, AsyncIterator
+
+from api.minecraft_server import STATUSES
+from api.supervisor_client import SupervisorClient, SupervisorError
+
+
+@dataclass
+class Node:
+    id: str
+    host: str
+    port: int
+    client: SupervisorClient
+    capacity: dict = field(default_factory=dict)
+    last_seen: float = 0
+    # ram promised to servers placed since the last heartbeat, in bytes
+    pending_ram: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "host": self.host,
+            "port": self.port,
+            "capacity": self.capacity,
+            "last_seen": self.last_seen
+        }
+
+
+class FleetManager:
+    """
+    Coordinator that manages servers on several hosts through their node agents.
+
+    Node agents register themselves and report their capacity with every heartbeat. New servers are placed
+    on the node with the most free memory, weighted by how idle its cpu is, and every other call is
+    forwarded to the node that owns the server. Exposes the same methods as ServerManager.
+    """
+
+    def __init__(self, token: Optional[str] = None, node_timeout: float = 30, server_ram: int = 1024):
+        self.token = token
+        self.node_timeout = node_timeout
+        self.server_ram = server_ram
+        self._nodes: Dict[str, Node] = {}
+        self._server_nodes: Dict[int, str] = {}
+        self._jobs: Dict[int, Tuple[str, int]] = {}
+        self._job_ids = itertools.count(1)
+        self._executor = ThreadPoolExecutor(16, thread_name_prefix="fleet")
+        self._lock = Lock()
+
+    def register_node(self, node_id: str, host: str, port: int, capacity: dict):
+        """
+        Register a node agent or refresh its capacity
+        """
+        with self._lock:
+            node = self._nodes.get(node_id)
+            if node is None or node.host != host or node.port != port:
+                node = Node(node_id, host, port, SupervisorClient((host, port), self.token))
+                self._nodes[node_id] = node
+                print(f"Node {node_id} registered at {host}:{port}")
+            node.capacity = capacity
+            node.last_seen = time.time()
+            node.pending_ram = 0
+            for server_id in capacity.get("server_ids", []):
+                self._server_nodes[server_id] = node_id
+
+    def get_nodes(self) -> List[dict]:
+        with self._lock:
+            return [dict(node.to_dict(), online=self._is_online(node)) for node in self._nodes.values()]
+
+    def _is_online(self, node: Node) -> bool:
+        return time.time() - node.last_seen < self.node_timeout
+
+    def _online_nodes(self) -> List[Node]:
+        with self._lock:
+            return [node for node in self._nodes.values() if self._is_online(node)]
+
+    def _get_node(self, server_id: int) -> Optional[Node]:
+        with self._lock:
+            node_id = self._server_nodes.get(server_id)
+            return self._nodes.get(node_id) if node_id is not None else None
+
+    def _place(self, ram: int) -> Node:
+        """
+        Pick the node a new server with ram MB should run on
+        """
+        best = None
+        best_score = None
+        with self._lock:
+            for node in self._nodes.values():
+                if not self._is_online(node):
+                    continue
+                free = node.capacity.get("memory_available", 0) - node.pending_ram
+                if free < ram * 1024 * 1024:
+                    continue
+                score = free * (1 - node.capacity.get("cpu_percent", 0) / 100)
+                if best_score is None or score > best_score:
+                    best, best_score = node, score
+            if best is None:
+                raise SupervisorError(f"No node has {ram} MB of memory available")
+            best.pending_ram += ram * 1024 * 1024
+        return best
+
+    def create_server(self, data: dict) -> Tuple[int, int]:
+        node = self._place(self.server_ram)
+        with self._lock:
+            server_id = 0
+            while server_id == 0 or server_id in self._server_nodes:
+                server_id = random.randint(1000, 9999)
+            self._server_nodes[server_id] = node.id
+        try:
+            server_id, node_job_id = node.client.create_server(data=data, server_id=server_id)
+        except Exception:
+            with self._lock:
+                self._server_nodes.pop(server_id, None)
+                node.pending_ram = max(node.pending_ram - self.server_ram * 1024 * 1024, 0)
+            raise
+        job_id = next(self._job_ids)
+        with self._lock:
+            self._jobs[job_id] = (node.id, node_job_id)
+        return server_id, job_id
+
+    def _call_server(self, server_id: int, method: str, default=None, **params):
+        node = self._get_node(server_id)
+        if node is None:
+            return default
+        return node.client.call(method, server_id=server_id, **params)
+
+    def _call_all(self, method: str, **params) -> Dict[str, object]:
+        nodes = self._online_nodes()
+        futures = {node.id: self._executor.submit(node.client.call, method, **params) for node in nodes}
+        results = {}
+        for node_id, future in futures.items():
+            try:
+                results[node_id] = future.result()
+            except (OSError, SupervisorError, ValueError) as e:
+                print(f"Node {node_id} failed to answer {method}: {e}")
+        return results
+
+    def get_available_versions(self) -> List[str]:
+        for versions in self._call_all("get_available_versions").values():
+            if versions:
+                return versions
+        return []
+
+    def get_all_server_data(self) -> dict:
+        data = {}
+        for node_id, servers in self._call_all("get_all_server_data").items():
+            for server_id, server_data in servers.items():
+                server_data["node"] = node_id
+                data[server_id] = server_data
+        return data
+
+    def get_server_data(self, server_id: int) -> Optional[dict]:
+        data = self._call_server(server_id, "get_server_data")
+        if data is not None:
+            data["node"] = self._server_nodes.get(server_id)
+        return data
+
+    def start_server(self, server_id: int) -> Tuple[bool, str]:
+        return self._call_server(server_id, "start_server", (False, "Couldn't start server: server does not exist!"))
+
+    def stop_server(self, server_id: int) -> Tuple[bool, str]:
+        return self._call_server(server_id, "stop_server", (False, "Couldn't stop server: server does not exist!"))
+
+    def player_command(self, server_id: int, player: str, command: str) -> Tuple[bool, str]:
+        return self._call_server(server_id, "player_command",
+                                 (False, f"Failed to {command} {player}: server does not exist!"),
+                                 player=player, command=command)
+
+    def perform_action(self, server_id: int, action: str, action_data: Optional[dict] = None) -> Tuple[bool, str]:
+        return self._call_server(server_id, "perform_action", (False, f"Failed to {action}: server does not exist!"),
+                                 action=action, action_data=action_data)
+
+    def run_actions(self, items: List[dict]) -> List[dict]:
+        """
+        Split a batch by node, items targeting a selector instead of a server id go to every node
+        """
+        node_items = {}
+        results = []
+        for item in items:
+            selector = item["server"]
+            if isinstance(selector, int):
+                node = self._get_node(selector)
+                if node is None:
+                    raise ValueError(f"Server {selector} does not exist")
+                node_items.setdefault(node.id, (node, []))[1].append(item)
+            elif selector != "all" and selector not in STATUSES:
+                raise ValueError(f"Unknown server selector {selector}, use a server id, \"all\" or a status")
+            else:
+                for node in self._online_nodes():
+                    node_items.setdefault(node.id, (node, []))[1].append(item)
+        futures = {node_id: self._executor.submit(node.client.run_actions, items=batch)
+                   for node_id, (node, batch) in node_items.items()}
+        for node_id, future in futures.items():
+            try:
+                results.extend(future.result())
+            except (OSError, SupervisorError, ValueError) as e:
+                print(f"Node {node_id} failed to answer run_actions: {e}")
+        return results
+
+    def get_start_queue(self) -> dict:
+        return self._call_all("get_start_queue")
+
+    def set_hibernation(self, server_id: int, enabled: bool, idle_minutes: int) -> Optional[dict]:
+        return self._call_server(server_id, "set_hibernation", enabled=enabled, idle_minutes=idle_minutes)
+
+    def set_hardware_config(self, server_id: int, ram: int, jvm_profile: str, cpu_cores: int, cpu_limit: float = 0,
+                            memory_limit: int = 0, io_bps: int = 0) -> Optional[dict]:
+        return self._call_server(server_id, "set_hardware_config", ram=ram, jvm_profile=jvm_profile,
+                                 cpu_cores=cpu_cores, cpu_limit=cpu_limit, memory_limit=memory_limit, io_bps=io_bps)
+
+    def get_jvm_profiles(self) -> dict:
+        for profiles in self._call_all("get_jvm_profiles").values():
+            return profiles
+        return {}
+
+    def create_backup(self, server_id: int) -> Optional[dict]:
+        return self._call_server(server_id, "create_backup")
+
+    def get_backups(self, server_id: int) -> Optional[dict]:
+        return self._call_server(server_id, "get_backups")
+
+    def restore_backup(self, server_id: int, backup_id: str) -> Optional[dict]:
+        return self._call_server(server_id, "restore_backup", backup_id=backup_id)
+
+    def get_players(self, server_id: int) -> Optional[dict]:
+        return self._call_server(server_id, "get_players")
+
+    def get_server_metrics(self, server_id: int, start: Optional[float] = None, end: Optional[float] = None,
+                           step: Optional[float] = None) -> Optional[dict]:
+        return self._call_server(server_id, "get_server_metrics", start=start, end=end, step=step)
+
+    def get_server_logs(self, server_id: int, from_line: Optional[int] = None, limit: int = 1000) -> Optional[dict]:
+        return self._call_server(server_id, "get_server_logs", from_line=from_line, limit=limit)
+
+    def search_server_logs(self, server_id: int, query: str, regex: bool = False, since: Optional[float] = None,
+                           limit: int = 1000) -> List[dict]:
+        return self._call_server(server_id, "search_server_logs", [], query=query, regex=regex, since=since,
+                                 limit=limit)
+
+    async def subscribe(self, server_id: int, offset: Optional[int] = None) -> AsyncIterator[dict]:
+        node = self._get_node(server_id)
+        if node is None:
+            return
+        frames = node.client.subscribe(server_id, offset)
+        try:
+            async for frame in frames:
+                yield frame
+        finally:
+            await frames.aclose()
+
+    def get_jars(self) -> List[dict]:
+        jars = []
+        for node_id, node_jars in self._call_all("get_jars").items():
+            for jar in node_jars:
+                jar["node"] = node_id
+                jars.append(jar)
+        return jars
+
+    def prewarm_jars(self, versions: List[str]) -> dict:
+        return self._call_all("prewarm_jars", versions=versions)
+
+    def evict_unused_jars(self) -> dict:
+        return self._call_all("evict_unused_jars")
+
+    def get_jobs(self) -> List[dict]:
+        with self._lock:
+            jobs = dict(self._jobs)
+        node_jobs = {node_id: {job["id"]: job for job in node_job_list}
+                     for node_id, node_job_list in self._call_all("get_jobs").items()}
+        result = []
+        for job_id, (node_id, node_job_id) in jobs.items():
+            if node_id not in node_jobs:
+                continue
+            job = node_jobs[node_id].get(node_job_id)
+            if job is not None:
+                result.append(dict(job, id=job_id, node=node_id))
+            else:
+                # the node doesn't keep this job anymore
+                with self._lock:
+                    self._jobs.pop(job_id, None)
+        return result
+
+    def get_job(self, job_id: int) -> Optional[dict]:
+        with self._lock:
+            node_job = self._jobs.get(job_id)
+            node = self._nodes.get(node_job[0]) if node_job is not None else None
+        if node is None:
+            return None
+        job = node.client.get_job(job_id=node_job[1])
+        if job is not None:
+            job = dict(job, id=job_id, node=node.id)
+        return job
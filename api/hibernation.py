@@ -0,0 +1,227 @@
+import asyncio
+import json
+import time
+from threading import Thread, Lock
+from typing import Callable, Dict, Tuple
+
+# packets are limited to a few KB before the login is done, anything bigger isn't a minecraft client
+MAX_PACKET_SIZE = 32 * 1024
+
+STATE_STATUS = 1
+STATE_LOGIN = 2
+
+
+def decode_varint(data: bytes, offset: int = 0) -> Tuple[int, int]:
+    """
+    Decode the VarInt at offset
+    :return: the value and the offset after it
+    """
+    value = 0
+    for i in range(5):
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return value, offset
+    raise ValueError("VarInt is too big")
+
+
+async def read_varint(reader: asyncio.StreamReader) -> int:
+    data = b""
+    while len(data) < 5:
+        data += await reader.readexactly(1)
+        if not data[-1] & 0x80:
+            return decode_varint(data)[0]
+    raise ValueError("VarInt is too big")
+
+
+def encode_varint(value: int) -> bytes:
+    data = b""
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            data += bytes([byte | 0x80])
+        else:
+            return data + bytes([byte])
+
+
+def encode_string(value: str) -> bytes:
+    data = value.encode()
+    return encode_varint(len(data)) + data
+
+
+def encode_packet(packet_id: int, payload: bytes) -> bytes:
+    data = encode_varint(packet_id) + payload
+    return encode_varint(len(data)) + data
+
+
+async def read_packet(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    length = await read_varint(reader)
+    if not 0 < length <= MAX_PACKET_SIZE:
+        raise ValueError(f"Invalid packet length {length}")
+    data = await reader.readexactly(length)
+    packet_id, offset = decode_varint(data)
+    return packet_id, data[offset:]
+
+
+def parse_handshake(payload: bytes) -> Tuple[int, int]:
+    """
+    Get the protocol version and the requested next state from a handshake packet
+    """
+    protocol, offset = decode_varint(payload)
+    address_length, offset = decode_varint(payload, offset)
+    # skip the server address and port
+    next_state, _ = decode_varint(payload, offset + address_length + 2)
+    return protocol, next_state
+
+
+class Hibernator(Thread):
+    """
+    Stops servers nobody plays on and starts them again once someone tries to join.
+
+    Every check_interval seconds the running servers with hibernation enabled are checked for online players.
+    A server that was empty for its idle_minutes is stopped and its port is taken over by a small listener on
+    this thread's event loop. The listener answers server list pings with the server's cached MOTD, so it still
+    shows up in the client, and starts the server when a client tries to log in. That client is disconnected
+    with a message to reconnect in a moment, as the login can't be handed over to the real server.
+    """
+
+    def __init__(self, start_server: Callable[[int], Tuple[bool, str]], check_interval: float = 30,
+                 host: str = ""):
+        super().__init__(daemon=True)
+        self.start_server = start_server
+        self.check_interval = check_interval
+        self.host = host or None
+        self.loop = asyncio.new_event_loop()
+        self._servers: Dict[int, "MinecraftServer"] = {}
+        self._idle_since: Dict[int, float] = {}
+        self._stopping = set()
+        self._listeners: Dict[int, asyncio.AbstractServer] = {}
+        self._lock = Lock()
+
+    def track(self, server: "MinecraftServer"):
+        with self._lock:
+            self._servers[server.id] = server
+        server.state_listeners.append(self._on_state)
+
+    def untrack(self, server: "MinecraftServer"):
+        with self._lock:
+            self._servers.pop(server.id, None)
+            self._idle_since.pop(server.id, None)
+            self._stopping.discard(server.id)
+        if self._on_state in server.state_listeners:
+            server.state_listeners.remove(self._on_state)
+        self._close_listener(server.id)
+
+    def release(self, server: "MinecraftServer"):
+        """
+        Stop listening for a hibernating server, it is stopped afterwards
+        """
+        if server.get_status() == "hibernating":
+            server.set_state("stopped")
+
+    def _on_state(self, server: "MinecraftServer", state: str):
+        if state == "stopped" and server.id in self._stopping:
+            self._stopping.discard(server.id)
+            asyncio.run_coroutine_threadsafe(self._listen(server), self.loop)
+        elif state != "hibernating":
+            # started by hand, the server needs its port back
+            self._close_listener(server.id)
+
+    def _close_listener(self, server_id: int):
+        listener = self._listeners.pop(server_id, None)
+        if listener is not None:
+            self.loop.call_soon_threadsafe(listener.close)
+
+    def run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._check_idle())
+
+    async def _check_idle(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            now = time.time()
+            with self._lock:
+                servers = list(self._servers.values())
+            for server in servers:
+                config = server.hibernation_config
+                if not config.enabled or server.get_status() != "running" or server.player_cache.online:
+                    self._idle_since.pop(server.id, None)
+                    continue
+                idle_since = self._idle_since.setdefault(server.id, now)
+                if now - idle_since >= config.idle_minutes * 60:
+                    print(f"Server {server.id} has been empty for {config.idle_minutes} minutes, hibernating")
+                    del self._idle_since[server.id]
+                    self._stopping.add(server.id)
+                    if not await self.loop.run_in_executor(None, server.stop):
+                        self._stopping.discard(server.id)
+
+    async def _listen(self, server: "MinecraftServer"):
+        motd = {
+            "text": server.server_properties.get("motd", "A Minecraft Server")
+        }
+        max_players = int(server.server_properties.get("max-players", 20))
+
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                await asyncio.wait_for(self._handle_client(server, motd, max_players, reader, writer), 10)
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                pass
+            finally:
+                writer.close()
+
+        # the JVM might not have released the port yet
+        for _ in range(10):
+            if server.get_status() != "stopped":
+                # started again in the meantime
+                return
+            try:
+                listener = await asyncio.start_server(handle, self.host, server.network_config.port)
+                break
+            except OSError:
+                await asyncio.sleep(1)
+        else:
+            print(f"Couldn't listen on port {server.network_config.port}, server {server.id} won't wake up")
+            return
+        if server.get_status() != "stopped":
+            listener.close()
+            return
+        self._listeners[server.id] = listener
+        server.set_state("hibernating")
+
+    async def _handle_client(self, server: "MinecraftServer", motd: dict, max_players: int,
+                             reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        packet_id, payload = await read_packet(reader)
+        if packet_id != 0:
+            return
+        protocol, next_state = parse_handshake(payload)
+        if next_state == STATE_STATUS:
+            await read_packet(reader)
+            status = {
+                "version": {"name": server.server_manager_data.version, "protocol": protocol},
+                "players": {"max": max_players, "online": 0},
+                "description": motd
+            }
+            writer.write(encode_packet(0, encode_string(json.dumps(status))))
+            await writer.drain()
+            packet_id, payload = await read_packet(reader)
+            if packet_id == 1:
+                # pong with the client's payload
+                writer.write(encode_packet(1, payload))
+                await writer.drain()
+        elif next_state == STATE_LOGIN:
+            await read_packet(reader)
+            reason = {"text": "The server is starting, please reconnect in a moment"}
+            writer.write(encode_packet(0, encode_string(json.dumps(reason))))
+            await writer.drain()
+            self._wake(server)
+
+    def _wake(self, server: "MinecraftServer"):
+        listener = self._listeners.pop(server.id, None)
+        if listener is None:
+            # another client woke it already
+            return
+        listener.close()
+        print(f"Waking up server {server.id}")
+        self.loop.run_in_executor(None, self.start_server, server.id)
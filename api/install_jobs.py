@@ -0,0 +1,107 @@
+import itertools
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from queue import Queue
+from threading import Thread, Lock, Semaphore
+from typing import Callable, Optional, List
+from urllib.parse import urlparse
+
+from api.download import DownloadProgress
+
+
+@dataclass
+class InstallJob:
+    id: int
+    server_id: int
+    version: str
+    state: str = "queued"
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.now)
+    finished_at: Optional[datetime] = None
+    progress: DownloadProgress = field(default_factory=DownloadProgress)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "server_id": self.server_id,
+            "version": self.version,
+            "state": self.state,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress.__dict__
+        }
+
+
+class InstallJobScheduler:
+    """
+    Runs server installs on a fixed pool of worker threads.
+
+    Jobs wait in a queue until a worker is free, and downloads from the same host are limited to
+    per_host at a time. Finished jobs are kept until there are more than history of them.
+    """
+
+    def __init__(self, workers: int = 4, per_host: int = 2, history: int = 100):
+        self.history = history
+        self._queue = Queue()
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = Lock()
+        self._host_slots = defaultdict(lambda: Semaphore(per_host))
+        self._workers = []
+        for _ in range(workers):
+            worker = Thread(target=self._work, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, server_id: int, version: str, task: Callable[[InstallJob], None]) -> InstallJob:
+        """
+        Queue an install
+        :param server_id: the server that gets installed
+        :param version: the minecraft version that gets installed
+        :param task: called with the job by a worker, should update the job's state as it goes
+        :return: the queued job
+        """
+        with self._lock:
+            job = InstallJob(next(self._ids), server_id, version)
+            self._jobs[job.id] = job
+            self._prune()
+        self._queue.put((job, task))
+        return job
+
+    def _prune(self):
+        finished = [job.id for job in self._jobs.values() if job.state in ("done", "failed")]
+        for job_id in finished[:max(len(finished) - self.history, 0)]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job, task = self._queue.get()
+            try:
+                task(job)
+                job.state = "done"
+            except Exception as e:
+                print(f"Install job {job.id} failed: {e}")
+                job.state = "failed"
+                job.error = str(e)
+            job.finished_at = datetime.now()
+            self._queue.task_done()
+
+    @contextmanager
+    def host_slot(self, url: str):
+        """
+        Wait until less than per_host downloads from url's host are running
+        """
+        with self._lock:
+            slot = self._host_slots[urlparse(url).hostname]
+        with slot:
+            yield
+
+    def get_job(self, job_id: int) -> Optional[InstallJob]:
+        return self._jobs.get(job_id)
+
+    def get_jobs(self) -> List[InstallJob]:
+        with self._lock:
+            return list(self._jobs.values())
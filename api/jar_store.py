@@ -0,0 +1,147 @@
+import hashlib
+import os
+import shutil
+from threading import Lock
+from typing import Optional, List, Iterable
+
+from api.download import download_file, DownloadProgress
+from api.minecraft_server_versions import AvailableMinecraftServerVersions
+
+try:
+    import fcntl
+except ImportError:  # not available on windows
+    fcntl = None
+
+FICLONE = 0x40049409
+
+
+def file_sha1(path: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class JarStore:
+    """
+    Local store of server jars shared by all servers.
+
+    Jars are stored as <path>/<version>/<sha1>.jar. A jar is downloaded and its checksum verified only once,
+    installs then hardlink (or reflink/copy where that's not possible) the stored jar into the server directory.
+    """
+
+    def __init__(self, server_versions: AvailableMinecraftServerVersions, path: str):
+        self.server_versions = server_versions
+        self.path = path
+        self._locks = {}
+        self._lock = Lock()
+
+    def _version_lock(self, version: str) -> Lock:
+        with self._lock:
+            return self._locks.setdefault(version, Lock())
+
+    def get(self, version: str) -> Optional[str]:
+        """
+        Get the path of the stored jar of a version
+        :return: the path or None if the version isn't in the store
+        """
+        version_path = os.path.join(self.path, version)
+        if os.path.isdir(version_path):
+            for file in os.listdir(version_path):
+                if file.endswith(".jar"):
+                    return os.path.join(version_path, file)
+        return None
+
+    def ensure(self, version: str, progress: Optional[DownloadProgress] = None) -> str:
+        """
+        Download the jar of a version into the store if it isn't stored yet
+        :param version: the minecraft version
+        :param progress: updated while the jar is downloaded
+        :return: the path of the stored jar
+        """
+        with self._version_lock(version):
+            jar_path = self.get(version)
+            if jar_path is None:
+                jar_path = self._download(version, progress)
+            return jar_path
+
+    def _download(self, version: str, progress: Optional[DownloadProgress]) -> str:
+        info = self.server_versions.get_download_info(version)
+        version_path = os.path.join(self.path, version)
+        os.makedirs(version_path, exist_ok=True)
+        tmp_path = os.path.join(version_path, "download.tmp")
+        download_file(info["url"], tmp_path, progress)
+        sha1 = file_sha1(tmp_path)
+        if info["sha1"] is not None and sha1 != info["sha1"]:
+            os.remove(tmp_path)
+            raise ValueError(f"Checksum mismatch for minecraft {version}: expected {info['sha1']}, got {sha1}")
+        jar_path = os.path.join(version_path, f"{sha1}.jar")
+        os.replace(tmp_path, jar_path)
+        return jar_path
+
+    def link(self, version: str, destination: str, progress: Optional[DownloadProgress] = None):
+        """
+        Put the jar of a version at destination, downloading it into the store first if needed
+        """
+        jar_path = self.ensure(version, progress)
+        if os.path.lexists(destination):
+            os.remove(destination)
+        try:
+            os.link(jar_path, destination)
+            return
+        except OSError:
+            pass
+        if fcntl is not None:
+            try:
+                with open(jar_path, "rb") as src, open(destination, "wb") as dst:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return
+            except OSError:
+                pass
+        shutil.copyfile(jar_path, destination)
+
+    def prewarm(self, versions: Iterable[str]) -> dict:
+        """
+        Download the jars of the given versions
+        :return: dict with the stored path or the error for each version
+        """
+        results = {}
+        for version in versions:
+            try:
+                results[version] = {"success": True, "path": self.ensure(version)}
+            except Exception as e:
+                results[version] = {"success": False, "error": str(e)}
+        return results
+
+    def evict(self, versions_in_use: Iterable[str]) -> List[str]:
+        """
+        Remove all stored versions that aren't in versions_in_use
+        :return: the removed versions
+        """
+        versions_in_use = set(versions_in_use)
+        removed = []
+        for version in self.list_versions():
+            if version not in versions_in_use:
+                with self._version_lock(version):
+                    shutil.rmtree(os.path.join(self.path, version), ignore_errors=True)
+                removed.append(version)
+        return removed
+
+    def list_versions(self) -> List[str]:
+        if not os.path.isdir(self.path):
+            return []
+        return [version for version in os.listdir(self.path) if self.get(version) is not None]
+
+    def get_jars(self) -> List[dict]:
+        jars = []
+        for version in self.list_versions():
+            jar_path = self.get(version)
+            stat = os.stat(jar_path)
+            jars.append({
+                "version": version,
+                "sha1": os.path.basename(jar_path)[:-len(".jar")],
+                "size": stat.st_size,
+                "links": stat.st_nlink
+            })
+        return jars
@@ -0,0 +1,103 @@
+from typing import List, Optional, Dict
+
+# flags of every profile, heap size flags are added for all of them
+PROFILES = {
+    "default": [],
+    # https://docs.papermc.io/paper/aikars-flags
+    "aikar": [
+        "-XX:+UseG1GC",
+        "-XX:+ParallelRefProcEnabled",
+        "-XX:MaxGCPauseMillis=200",
+        "-XX:+UnlockExperimentalVMOptions",
+        "-XX:+DisableExplicitGC",
+        "-XX:+AlwaysPreTouch",
+        "-XX:G1HeapWastePercent=5",
+        "-XX:G1MixedGCCountTarget=4",
+        "-XX:G1MixedGCLiveThresholdPercent=90",
+        "-XX:G1RSetUpdatingPauseTimePercent=5",
+        "-XX:SurvivorRatio=32",
+        "-XX:+PerfDisableSharedMem",
+        "-XX:MaxTenuringThreshold=1",
+        "-Dusing.aikars.flags=https://mcflags.emc.gs",
+        "-Daikars.new.flags=true"
+    ],
+    "zgc": [
+        "-XX:+UseZGC",
+        "-XX:+AlwaysPreTouch",
+        "-XX:+DisableExplicitGC",
+        "-XX:+PerfDisableSharedMem"
+    ]
+}
+
+
+def _aikar_heap_flags(ram: int) -> List[str]:
+    """
+    The G1 region and generation sizes of Aikar's flags depend on the heap size
+    """
+    if ram >= 12 * 1024:
+        return ["-XX:G1NewSizePercent=40", "-XX:G1MaxNewSizePercent=50", "-XX:G1HeapRegionSize=16M",
+                "-XX:G1ReservePercent=15", "-XX:InitiatingHeapOccupancyPercent=20"]
+    return ["-XX:G1NewSizePercent=30", "-XX:G1MaxNewSizePercent=40", "-XX:G1HeapRegionSize=8M",
+            "-XX:G1ReservePercent=20", "-XX:InitiatingHeapOccupancyPercent=15"]
+
+
+def large_pages_flag() -> Optional[str]:
+    """
+    Get the flag to back the heap with large pages, if the host has any configured
+    """
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("HugePages_Total:") and int(line.split()[1]) > 0:
+                    return "-XX:+UseLargePages"
+    except OSError:
+        return None
+    try:
+        with open("/sys/kernel/mm/transparent_hugepage/enabled", "r") as f:
+            # the active mode is in brackets, e.g. "always [madvise] never"
+            if "[never]" not in f.read():
+                return "-XX:+UseTransparentHugePages"
+    except OSError:
+        pass
+    return None
+
+
+def get_profiles(custom_profiles: Optional[Dict[str, List[str]]] = None) -> Dict[str, List[str]]:
+    """
+    Get the built in profiles and the custom ones from the config, custom ones replace built in ones
+    """
+    profiles = dict(PROFILES)
+    profiles.update(custom_profiles or {})
+    return profiles
+
+
+def build_command(java: str, jar_path: str, ram: int, profile: str = "default",
+                  active_processor_count: int = 0, large_pages: bool = False,
+                  custom_profiles: Optional[Dict[str, List[str]]] = None) -> List[str]:
+    """
+    Build the command line to start a server
+    :param java: the java executable
+    :param jar_path: the server jar, relative to the server's directory
+    :param ram: heap size in MB
+    :param profile: name of the JVM profile, see PROFILES
+    :param active_processor_count: number of cores the JVM sizes its thread pools for, 0 to let it detect them
+    :param large_pages: whether to use large pages if the host has them
+    :param custom_profiles: additional profiles from the config
+    :return: the command
+    """
+    profiles = get_profiles(custom_profiles)
+    if profile not in profiles:
+        raise ValueError(f"Unknown JVM profile {profile}")
+    command = [java, f"-Xmx{ram}M", f"-Xms{ram}M"]
+    command.extend(profiles[profile])
+    if profiles[profile] is PROFILES["aikar"]:
+        command.extend(_aikar_heap_flags(ram))
+    if active_processor_count:
+        command.append(f"-XX:ActiveProcessorCount={active_processor_count}")
+    if large_pages:
+        flag = large_pages_flag()
+        if flag is not None:
+            command.append(flag)
+    command.extend(["-jar", jar_path, "--nogui"])
+    return command
+
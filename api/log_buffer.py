@@ -0,0 +1,85 @@
+import threading
+from collections import deque
+from typing import Tuple
+
+
+class _Chunk:
+    __slots__ = ("start", "lines", "size")
+
+    def __init__(self, start: int):
+        self.start = start
+        self.lines = []
+        self.size = 0
+
+
+class LogBuffer:
+    """
+    Bounded store for console output.
+
+    Lines are kept in fixed-size chunks and addressed by a monotonically increasing line offset, so a reader
+    can ask for everything after the last offset it has seen. Once more than max_size characters are held,
+    the oldest chunks are dropped; offsets keep counting up regardless.
+    """
+
+    def __init__(self, max_size: int = 4 * 1024 * 1024, chunk_lines: int = 256):
+        self.max_size = max_size
+        self.chunk_lines = chunk_lines
+        self._chunks = deque()
+        self._size = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    @property
+    def first_offset(self) -> int:
+        """
+        Offset of the oldest line still held in the buffer
+        """
+        with self._lock:
+            return self._chunks[0].start if self._chunks else self._end
+
+    @property
+    def end_offset(self) -> int:
+        """
+        Offset the next appended line will get
+        """
+        return self._end
+
+    def append(self, line: str):
+        with self._lock:
+            if not self._chunks or len(self._chunks[-1].lines) >= self.chunk_lines:
+                self._chunks.append(_Chunk(self._end))
+            chunk = self._chunks[-1]
+            chunk.lines.append(line)
+            chunk.size += len(line)
+            self._size += len(line)
+            self._end += 1
+            while self._size > self.max_size and len(self._chunks) > 1:
+                self._size -= self._chunks.popleft().size
+
+    def read_since(self, offset: int = 0) -> Tuple[str, int]:
+        """
+        Get all lines from offset on
+        :param offset: line offset to start at, offsets older than the buffer start at the oldest retained line
+        :return: the joined lines and the offset to continue reading from
+        """
+        with self._lock:
+            if not self._chunks or offset >= self._end:
+                return "", self._end
+            first = self._chunks[0].start
+            offset = max(offset, first)
+            index = (offset - first) // self.chunk_lines
+            parts = []
+            for i in range(index, len(self._chunks)):
+                chunk = self._chunks[i]
+                parts.extend(chunk.lines[offset - chunk.start:] if i == index else chunk.lines)
+            return "".join(parts), self._end
+
+    def __contains__(self, text: str) -> bool:
+        with self._lock:
+            return any(text in line for chunk in self._chunks for line in chunk.lines)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __str__(self) -> str:
+        return self.read_since(0)[0]
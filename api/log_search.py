@@ -0,0 +1,98 @@
+import gzip
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Iterator, List, Tuple
+
+from api.log_segments import SegmentedLog
+
+
+def compile_query(query: str, regex: bool = False, ignore_case: bool = False) -> re.Pattern:
+    """
+    Compile a search query to a bytes pattern, raises re.error for invalid regular expressions
+    """
+    pattern = query if regex else re.escape(query)
+    # segments are searched as a whole, ^ and $ have to match at every line
+    flags = re.MULTILINE
+    if ignore_case:
+        flags |= re.IGNORECASE
+    return re.compile(pattern.encode(), flags)
+
+
+def _search_buffer(buffer, pattern: re.Pattern, first_line: int, limit: int) -> List[Tuple[int, str]]:
+    matches = []
+    line_number = first_line
+    position = 0
+    match = pattern.search(buffer)
+    while match is not None and len(matches) < limit:
+        if match.start() == len(buffer) and buffer[len(buffer) - 1:] in (b"", b"\n"):
+            # an empty match after the last line, e.g. of ^
+            break
+        line_start = buffer.rfind(b"\n", 0, match.start()) + 1
+        line_end = buffer.find(b"\n", match.start())
+        if line_end == -1:
+            line_end = len(buffer)
+        line_number += buffer[position:line_start].count(b"\n")
+        matches.append((line_number, buffer[line_start:line_end].decode(errors="replace")))
+        if line_end + 1 >= len(buffer):
+            break
+        position = line_start
+        match = pattern.search(buffer, line_end + 1)
+    return matches
+
+
+def search_segment(path: str, first_line: int, pattern: re.Pattern, limit: int) -> List[Tuple[int, str]]:
+    """
+    Find the lines of one segment matching pattern, runs in a worker process
+    :return: up to limit (line number, line) tuples
+    """
+    if not os.path.isfile(path) and os.path.isfile(f"{path}.gz"):
+        # the segment got compressed in the meantime
+        path = f"{path}.gz"
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            return _search_buffer(f.read(), pattern, first_line, limit)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _search_buffer(mm, pattern, first_line, limit)
+
+
+class LogSearcher:
+    """
+    Searches the console history of servers, one segment per worker process so all cores are used
+    """
+
+    def __init__(self, executor: ProcessPoolExecutor):
+        self.executor = executor
+
+    def search(self, log: SegmentedLog, pattern: re.Pattern, since: Optional[float] = None,
+               limit: int = 1000) -> Iterator[dict]:
+        """
+        Search all segments written to after since. since works on whole segments, console lines only have
+        the time of day and no date, so a segment that was written to after since is searched completely,
+        including its lines from before since.
+        :param log: the console log to search
+        :param pattern: compiled with compile_query
+        :param since: unix timestamp, segments last written to before it are skipped
+        :param limit: maximum number of matches
+        :return: the matches in line order, yielded as soon as the segments before them are searched
+        """
+        futures = []
+        for path, first_line, modified in log.get_segments():
+            if since is not None and modified < since:
+                continue
+            futures.append(self.executor.submit(search_segment, path, first_line, pattern, limit))
+        found = 0
+        try:
+            for future in futures:
+                for line_number, line in future.result():
+                    yield {"line": line_number, "text": line}
+                    found += 1
+                    if found >= limit:
+                        return
+        finally:
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,300 @@
+import bisect
+import gzip
+import mmap
+import os
+import re
+import shutil
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import List, Optional, Tuple
+
+SEGMENT_PATTERN = re.compile(r"^segment-(\d+)\.log(\.gz)?$")
+# full segments of all logs are compressed one after the other, off the threads appending to the logs
+_compressor = ThreadPoolExecutor(1, thread_name_prefix="log-compress")
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class _Segment:
+
+    def __init__(self, path: str, first_line: int, compressed: bool):
+        self.path = path
+        self.first_line = first_line
+        self.compressed = compressed
+        self.line_count = 0
+        # byte offset of every index_interval-th line
+        self.index = array("Q")
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(os.path.dirname(self.path), f"segment-{self.first_line:012d}.idx")
+
+
+class SegmentedLog:
+    """
+    Console output of one server, stored on disk in rotating segment files.
+
+    Lines are numbered across segments and restarts. Every segment has a sparse index with the byte offset of
+    every index_interval-th line, so any range of lines can be read through mmap without scanning the whole
+    history. Full segments are gzipped in the background if compress is set and the oldest ones are removed
+    beyond max_segments. Appended lines are buffered and flushed before they are read.
+    """
+
+    def __init__(self, path: str, segment_size: int = 16 * 1024 * 1024, index_interval: int = 1000,
+                 compress: bool = True, max_segments: int = 64):
+        self.path = path
+        self.segment_size = segment_size
+        self.index_interval = index_interval
+        self.compress = compress
+        self.max_segments = max_segments
+        self._segments: List[_Segment] = []
+        self._file = None
+        self._size = 0
+        self._lock = Lock()
+        self._opened = False
+
+    def _open(self):
+        if self._opened:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        files = sorted(os.listdir(self.path))
+        for file in files:
+            if file.endswith(".gz.tmp"):
+                # compressing it was interrupted
+                os.remove(os.path.join(self.path, file))
+                continue
+            match = SEGMENT_PATTERN.match(file)
+            if match is not None:
+                if match.group(2) is None and f"{file}.gz" in files:
+                    # compressed, but removing the original was interrupted
+                    os.remove(os.path.join(self.path, file))
+                    continue
+                self._segments.append(_Segment(os.path.join(self.path, file), int(match.group(1)),
+                                               match.group(2) is not None))
+        for segment, next_segment in zip(self._segments, self._segments[1:]):
+            segment.line_count = next_segment.first_line - segment.first_line
+            self._load_index(segment)
+        if self._segments:
+            self._load_index(self._segments[-1], count_lines=True)
+        if self._segments and not self._segments[-1].compressed:
+            segment = self._segments[-1]
+            self._file = open(segment.path, "ab")
+            self._size = self._file.tell()
+        self._opened = True
+
+    def _load_index(self, segment: _Segment, count_lines: bool = False):
+        """
+        Load a segment's index, counting its lines after the last indexed one if count_lines is set.
+        The index is rebuilt from the segment if it's missing.
+        """
+        if os.path.isfile(segment.index_path):
+            with open(segment.index_path, "rb") as f:
+                segment.index.frombytes(f.read())
+            if not count_lines:
+                return
+        else:
+            count_lines = True
+        start_block = max(len(segment.index) - 1, 0)
+        offset = segment.index[start_block] if segment.index else 0
+        line_count = start_block * self.index_interval
+        del segment.index[start_block:]
+        opener = gzip.open if segment.compressed else open
+        with opener(segment.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if line_count % self.index_interval == 0:
+                    segment.index.append(offset)
+                line_count += 1
+                offset += len(line)
+        segment.line_count = line_count
+        with open(segment.index_path, "wb") as f:
+            segment.index.tofile(f)
+
+    @property
+    def total_lines(self) -> int:
+        with self._lock:
+            self._open()
+            if not self._segments:
+                return 0
+            return self._segments[-1].first_line + self._segments[-1].line_count
+
+    @property
+    def first_line(self) -> int:
+        with self._lock:
+            self._open()
+            return self._segments[0].first_line if self._segments else 0
+
+    def append(self, line: str):
+        if not line.endswith("\n"):
+            line += "\n"
+        data = line.encode(errors="replace")
+        with self._lock:
+            self._open()
+            if self._file is None or self._size >= self.segment_size:
+                self._rotate()
+            segment = self._segments[-1]
+            if segment.line_count % self.index_interval == 0:
+                segment.index.append(self._size)
+                with open(segment.index_path, "ab") as f:
+                    f.write(segment.index[-1:].tobytes())
+            self._file.write(data)
+            self._size += len(data)
+            segment.line_count += 1
+
+    def _rotate(self):
+        first_line = 0
+        if self._segments:
+            last = self._segments[-1]
+            first_line = last.first_line + last.line_count
+        if self._file is not None:
+            self._file.close()
+            if self.compress:
+                _compressor.submit(self._compress, self._segments[-1])
+        segment = _Segment(os.path.join(self.path, f"segment-{first_line:012d}.log"), first_line, False)
+        self._segments.append(segment)
+        self._file = open(segment.path, "ab")
+        self._size = 0
+        while len(self._segments) > self.max_segments:
+            old = self._segments.pop(0)
+            # a segment that is still being compressed is removed by _compress
+            _remove(old.path)
+            _remove(old.index_path)
+
+    def _compress(self, segment: _Segment):
+        """
+        Gzip a full segment, runs on the compressor thread
+        """
+        path = segment.path
+        compressed_path = f"{path}.gz"
+        try:
+            with open(path, "rb") as src, gzip.open(f"{compressed_path}.tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(f"{compressed_path}.tmp", compressed_path)
+        except OSError as e:
+            _remove(f"{compressed_path}.tmp")
+            if segment in self._segments:
+                print(f"Couldn't compress log segment {path}: {e}")
+            return
+        with self._lock:
+            pruned = segment not in self._segments
+            if not pruned:
+                # readers take both under the lock, the uncompressed file is still there for those reading it
+                segment.path = compressed_path
+                segment.compressed = True
+        if pruned:
+            _remove(compressed_path)
+        _remove(path)
+
+    def _flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def read(self, from_line: Optional[int] = None, limit: int = 1000) -> Tuple[List[str], int]:
+        """
+        Read up to limit lines
+        :param from_line: number of the first line, None reads the last limit lines
+        :param limit: maximum number of lines to read
+        :return: the lines and the number of the first line returned
+        """
+        with self._lock:
+            self._open()
+            self._flush()
+            if not self._segments:
+                return [], 0
+            end = self._segments[-1].first_line + self._segments[-1].line_count
+            if from_line is None:
+                from_line = end - limit
+            from_line = max(from_line, self._segments[0].first_line)
+            start_line = from_line
+            segments = [(segment, segment.path, segment.compressed) for segment in self._segments]
+        lines = []
+        index = bisect.bisect_right([segment.first_line for segment, _, _ in segments], from_line) - 1
+        for segment, path, compressed in segments[index:]:
+            if len(lines) >= limit:
+                break
+            try:
+                segment_lines = self._read_segment(segment, path, compressed, from_line - segment.first_line,
+                                                   limit - len(lines))
+            except FileNotFoundError:
+                # the segment got compressed or removed while reading it
+                with self._lock:
+                    pruned = segment not in self._segments
+                    path, compressed = segment.path, segment.compressed
+                if pruned:
+                    # its lines are gone, start after it so the returned lines stay contiguous
+                    lines = []
+                    from_line = segment.first_line + segment.line_count
+                    start_line = from_line
+                    continue
+                segment_lines = self._read_segment(segment, path, compressed, from_line - segment.first_line,
+                                                   limit - len(lines))
+            lines.extend(segment_lines)
+            from_line += len(segment_lines)
+        return lines, start_line
+
+    def _read_segment(self, segment: _Segment, path: str, compressed: bool, skip: int, limit: int) -> List[str]:
+        if skip >= segment.line_count and segment.line_count:
+            return []
+        block = skip // self.index_interval
+        offset = segment.index[block] if block < len(segment.index) else 0
+        skip -= block * self.index_interval if block < len(segment.index) else 0
+        lines = []
+        if compressed:
+            with gzip.open(path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if skip:
+                        skip -= 1
+                        continue
+                    lines.append(line.decode(errors="replace"))
+                    if len(lines) >= limit:
+                        break
+            return lines
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                position = offset
+                while position < len(mm) and len(lines) < limit:
+                    newline = mm.find(b"\n", position)
+                    if newline == -1:
+                        break
+                    if skip:
+                        skip -= 1
+                    else:
+                        lines.append(mm[position:newline + 1].decode(errors="replace"))
+                    position = newline + 1
+        return lines
+
+    def get_segments(self) -> List[Tuple[str, int, float]]:
+        """
+        Get path, first line number and modification time of every segment, oldest first
+        """
+        with self._lock:
+            self._open()
+            self._flush()
+            segments = [(segment.path, segment.first_line) for segment in self._segments]
+        result = []
+        for path, first_line in segments:
+            try:
+                modified = os.path.getmtime(path)
+            except OSError:
+                try:
+                    modified = os.path.getmtime(f"{path}.gz")
+                except OSError:
+                    # removed in the meantime
+                    continue
+            result.append((path, first_line, modified))
+        return result
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
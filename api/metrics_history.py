@@ -0,0 +1,152 @@
+import math
+import threading
+import time
+from array import array
+from typing import Callable, Iterator, List, Optional, Tuple
+
+METRICS = ("cpu", "memory", "players", "ping")
+
+
+class _Tier:
+    """
+    Fixed-size ring of buckets, each holding the average of every metric over step seconds
+    """
+
+    def __init__(self, step: float, size: int):
+        self.step = step
+        self.size = size
+        self.timestamps = array("d", [math.nan]) * size
+        self.values = {metric: array("d", [math.nan]) * size for metric in METRICS}
+        self.count = 0
+        self._bucket = None
+        self._sums = [0.0] * len(METRICS)
+        self._counts = [0] * len(METRICS)
+
+    @property
+    def retention(self) -> float:
+        return self.step * self.size
+
+    def add(self, timestamp: float, values: Tuple[float, ...]):
+        bucket = timestamp - timestamp % self.step
+        if self._bucket is not None and bucket != self._bucket:
+            self.flush()
+        self._bucket = bucket
+        for i, value in enumerate(values):
+            if not math.isnan(value):
+                self._sums[i] += value
+                self._counts[i] += 1
+
+    def flush(self):
+        if self._bucket is None:
+            return
+        index = self.count % self.size
+        self.timestamps[index] = self._bucket
+        for i, metric in enumerate(METRICS):
+            self.values[metric][index] = self._sums[i] / self._counts[i] if self._counts[i] else math.nan
+            self._sums[i] = 0.0
+            self._counts[i] = 0
+        self.count += 1
+        self._bucket = None
+
+    def ordered_indices(self) -> range:
+        if self.count <= self.size:
+            return range(self.count)
+        start = self.count % self.size
+        return range(start, start + self.size)
+
+    def rows(self) -> Iterator[Tuple[float, List[float]]]:
+        """
+        Timestamp and values of every bucket, oldest first, including the one that is still being filled
+        """
+        for i in self.ordered_indices():
+            index = i % self.size
+            yield self.timestamps[index], [self.values[metric][index] for metric in METRICS]
+        if self._bucket is not None:
+            yield self._bucket, [total / count if count else math.nan
+                                 for total, count in zip(self._sums, self._counts)]
+
+
+class MetricsHistory:
+    """
+    Per server time series of cpu, memory, player count and ping.
+
+    Samples are aggregated into several retention tiers (e.g. 1 second buckets for 10 minutes and 1 minute
+    buckets for 24 hours). Every tier is a set of preallocated arrays, so memory use is constant.
+    """
+
+    def __init__(self, tiers: List[Tuple[float, int]] = ((1, 600), (60, 1440)),
+                 player_count: Optional[Callable[[], int]] = None):
+        """
+        :param tiers: step in seconds and number of buckets of every tier
+        :param player_count: returns the number of online players, called for every sample
+        """
+        self._tiers = [_Tier(step, size) for step, size in sorted(tiers)]
+        self.player_count = player_count
+        self._ping = math.nan
+        self._lock = threading.Lock()
+
+    def set_ping(self, ping: Optional[float]):
+        """
+        Remember the latest ping, it is only stored with the next resource usage sample
+        """
+        self._ping = math.nan if ping is None else ping
+
+    def record(self, cpu: float, memory: float, timestamp: Optional[float] = None):
+        timestamp = time.time() if timestamp is None else timestamp
+        players = self.player_count() if self.player_count is not None else math.nan
+        values = (cpu, memory, players, self._ping)
+        self._ping = math.nan
+        with self._lock:
+            for tier in self._tiers:
+                tier.add(timestamp, values)
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None,
+              step: Optional[float] = None) -> dict:
+        """
+        Get the series between start and end, downsampled to step seconds
+        :param start: unix timestamp, defaults to ten minutes before end
+        :param end: unix timestamp, defaults to now
+        :param step: bucket size of the result, defaults to the step of the finest tier whose retention reaches
+        back to start
+        :return: dict with the step, a list of timestamps and one list of values per metric
+        """
+        now = time.time()
+        end = now if end is None else end
+        start = end - 600 if start is None else start
+        with self._lock:
+            candidates = [tier for tier in self._tiers if step is None or tier.step <= step] or self._tiers
+            tier = next((tier for tier in candidates if now - tier.retention <= start), None)
+            if tier is None:
+                tier = max(candidates, key=lambda t: t.retention)
+            step = max(step or tier.step, tier.step)
+            timestamps = []
+            columns = {metric: [] for metric in METRICS}
+            sums = [0.0] * len(METRICS)
+            counts = [0] * len(METRICS)
+            bucket = None
+            for timestamp, values in tier.rows():
+                if timestamp < start or timestamp > end:
+                    continue
+                current = timestamp - timestamp % step
+                if bucket is not None and current != bucket:
+                    self._append_bucket(bucket, sums, counts, timestamps, columns)
+                bucket = current
+                for m, value in enumerate(values):
+                    if not math.isnan(value):
+                        sums[m] += value
+                        counts[m] += 1
+            if bucket is not None:
+                self._append_bucket(bucket, sums, counts, timestamps, columns)
+        return {
+            "step": step,
+            "timestamps": timestamps,
+            **columns
+        }
+
+    @staticmethod
+    def _append_bucket(bucket: float, sums: list, counts: list, timestamps: list, columns: dict):
+        timestamps.append(bucket)
+        for m, metric in enumerate(METRICS):
+            columns[metric].append(round(sums[m] / counts[m], 2) if counts[m] else None)
+            sums[m] = 0.0
+            counts[m] = 0
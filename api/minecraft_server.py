@@ -1,18 +1,33 @@
-import json
 import os
+import secrets
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional
+from threading import Event
+from typing import List, Optional, Tuple
 
-import requests
+import psutil
 from mcstatus import MinecraftServer as MCStatusServer
 
 from api import utils
+from api.console_parser import ConsoleEvent, EXITED
+from api.cgroups import CgroupManager, Cgroup
+from api.cpu_placement import CpuPlacer
+from api.download import DownloadProgress
+from api.jar_store import JarStore
+from api.jvm_profiles import build_command
+from api.log_segments import SegmentedLog
+from api.metrics_history import MetricsHistory
 from api.minecraft_server_versions import AvailableMinecraftServerVersions
+from api.player_cache import PlayerCache, Player
 from api.process_handler import ProcessHandler
+from api.rcon import RconPool, RconError, FAILURE_RESPONSES
 from api.utils import create_eula
+from config import get_config
 
 
+# every status get_status can return
+STATUSES = ("installing", "stopped", "queued", "starting", "running", "stopping", "hibernating")
+
 @dataclass
 class MinecraftServerNetworkConfig:
     port: int
@@ -21,6 +36,20 @@ class MinecraftServerNetworkConfig:
 @dataclass
 class MinecraftServerHardwareConfig:
     ram: int
+    jvm_profile: str = "default"
+    # cores the server is pinned to if cpu placement is enabled, 0 for a share proportional to ram
+    cpu_cores: int = 0
+    # cgroup limits, 0 for no cpu and io limit and the default memory limit
+    cpu_limit: float = 0
+    memory_limit: int = 0
+    io_bps: int = 0
+
+
+@dataclass
+class MinecraftServerHibernationConfig:
+    enabled: bool = False
+    # minutes without online players before the server is stopped
+    idle_minutes: int = 15
 
 
 @dataclass
@@ -44,21 +73,12 @@ class MinecraftData:
     leveltype: str
 
 
-@dataclass
-class Player:
-    name: str
-    is_online: bool = False
-    is_op: Optional[bool] = False
-    is_banned: Optional[bool] = False
-    ban_reason: Optional[str] = None
-    ban_since: Optional[str] = None
-
-
 class MinecraftServer:
 
     def __init__(self, id: int, name: str, process_handler: ProcessHandler, path_data: MinecraftServerPathData,
                  network_config: MinecraftServerNetworkConfig, hardware_config: MinecraftServerHardwareConfig,
-                 server_manager_data: MCServerManagerData, server_versions: AvailableMinecraftServerVersions):
+                 server_manager_data: MCServerManagerData, server_versions: AvailableMinecraftServerVersions,
+                 hibernation_config: Optional[MinecraftServerHibernationConfig] = None):
         self.id = id
         self.name = name
         self.process_handler = process_handler
@@ -67,28 +87,42 @@ class MinecraftServer:
         self.path_data = path_data
         self.server_manager_data = server_manager_data
         self.server_versions = server_versions
+        self.hibernation_config = hibernation_config or MinecraftServerHibernationConfig()
 
         self.server_properties = {}
         self.pid = 0
         self.mcstatus_server = None
+        self.online_stats = {}
+        self.rcon = None
+        self.install_progress = DownloadProgress()
         self.players = {}
-
-        self.starting = False
-        self.stopping = False
+        self.player_cache = PlayerCache(self.path_data.base_path)
+        self.cpu_placer: Optional[CpuPlacer] = None
+        self.cpu_affinity = []
+        self.cgroups: Optional[CgroupManager] = None
+        self.cgroup: Optional[Cgroup] = None
+        self.metrics_history = MetricsHistory(get_config()["monitoring"]["history_tiers"],
+                                              lambda: len(self.player_cache.online))
+        logs_config = get_config()["logs"]
+        self.console_log = SegmentedLog(os.path.join(self.path_data.base_path, "console-logs"),
+                                        logs_config["segment_size"], logs_config["index_interval"],
+                                        logs_config["compress"], logs_config["max_segments"])
+
+        # one of stopped, queued, starting, running, stopping, hibernating
+        self.state = "stopped"
+        # called with the server and its new state on every state change
+        self.state_listeners = []
+        self._saved = Event()
+        self.last_crash = None
 
         self._logs = ""
 
-    def install(self, install_data: MinecraftData):
+    def install(self, install_data: MinecraftData, jar_store: JarStore):
         if not self.server_manager_data.installed:
             if self.server_manager_data.version in self.server_versions.available_versions:
                 os.makedirs(self.path_data.base_path, exist_ok=True)
-                headers = {
-                    "User-Agent": "Mozilla/5.0 (X11; Linux i686; rv:96.0) Gecko/20100101 Firefox/96.0"
-                }
-                data = requests.get(self.server_versions.get_download_link(self.server_manager_data.version),
-                                    headers=headers).content
-                with open(self.path_data.absolut_jar_path, "wb") as f:
-                    f.write(data)
+                jar_store.link(self.server_manager_data.version, self.path_data.absolut_jar_path,
+                               self.install_progress)
                 create_eula(self.path_data.base_path)
                 self.server_manager_data.installed = True
 
@@ -96,6 +130,9 @@ class MinecraftServer:
                     "server-port": self.network_config.port,
                     "query.port": self.network_config.port,
                     "enable-query": True,
+                    "enable-rcon": "true",
+                    "rcon.port": utils.get_free_port(),
+                    "rcon.password": secrets.token_urlsafe(16),
                     "level-name": "world/world",
                     "level-seed": install_data.seed,
                     "level-type": install_data.leveltype,
@@ -109,107 +146,200 @@ class MinecraftServer:
         utils.save_properties(self.path_data.server_properties_file, self.server_properties)
 
     def update(self):
-        self.pid = 0 if not self.process_handler.process_exists(self.pid) else self.pid
-        status = self.get_status()
-        if status == "stopped":
-            if self.stopping:
-                self.stopping = False
-                self.save_properties()
-            self.starting = False
-            self.mcstatus_server = None
-        elif status == "running":
-            if self.mcstatus_server is None:
-                print("creating status server")
-                self.mcstatus_server = MCStatusServer("localhost", self.network_config.port)
-        if self.starting:
-            self.starting = "For help, type \"help\"" not in self.process_handler.get_process(self.pid).logs
+        if self.state == "running" and self.mcstatus_server is None:
+            print("creating status server")
+            self.mcstatus_server = MCStatusServer("localhost", self.network_config.port,
+                                                  timeout=get_config()["status"]["timeout"])
         self._update_players()
 
     def _update_players(self) -> None:
-        self.players = {}
-        if self.mcstatus_server is not None:
-            self.players = self._get_online_players()
-        banned_players_file = os.path.join(self.path_data.base_path, "banned-players.json")
-        op_players_file = os.path.join(self.path_data.base_path, "ops.json")
-        if os.path.isfile(banned_players_file):
-            with open(banned_players_file, "r") as f:
-                banned_players = json.load(f)
-            for player in banned_players:
-                name = player["name"]
-                if name not in self.players:
-                    self.players[name] = Player(name)
-                self.players[name].is_banned = True
-                self.players[name].ban_reason = player["reason"]
-                self.players[name].ban_since = player["created"]
-            with open(op_players_file, "r") as f:
-                banned_players = json.load(f)
-            for player in banned_players:
-                name = player["name"]
-                if name not in self.players:
-                    self.players[name] = Player(name)
-                self.players[name].is_op = True
-
-    def _get_online_players(self) -> dict:
-        players = {}
-        online_players = self.mcstatus_server.query().players.names
-        for name in online_players:
-            player = Player(name)
-            player.is_online = True
-            players[name] = player
-        return players
+        self.player_cache.refresh()
+        self.players = self.player_cache.players
+
+    def _handle_event(self, event: ConsoleEvent):
+        """
+        Lifecycle state machine, driven by the events of the server's console parser
+        """
+        if event.type == "done":
+            if self.state == "starting":
+                self.set_state("running")
+            if self.rcon is None and self.server_properties.get("enable-rcon") == "true":
+                rcon_config = get_config()["rcon"]
+                self.rcon = RconPool("localhost", int(self.server_properties["rcon.port"]),
+                                     self.server_properties["rcon.password"], rcon_config["pool_size"],
+                                     rcon_config["timeout"])
+        elif event.type == "stopping":
+            if self.state in ("starting", "running"):
+                self.set_state("stopping")
+        elif event.type == "saved":
+            self._saved.set()
+        elif event.type == "crash":
+            self.last_crash = {
+                "time": datetime.now(),
+                "line": event.line,
+                **event.data
+            }
+        elif event.type == "player_join":
+            self.player_cache.set_online(event.data["player"], True)
+        elif event.type == "player_leave":
+            self.player_cache.set_online(event.data["player"], False)
+        elif event.type == EXITED:
+            self._handle_exit()
+
+    def _handle_exit(self):
+        if self.pid == 0:
+            return
+        print(f"Server {self.id} stopped")
+        if self.state == "stopping":
+            self.save_properties()
+        self.pid = 0
+        self.mcstatus_server = None
+        if self.rcon is not None:
+            self.rcon.close()
+            self.rcon = None
+        if self.cpu_placer is not None:
+            self.cpu_placer.release(self.id)
+            self.cpu_affinity = []
+        if self.cgroup is not None:
+            self.cgroup.remove()
+            self.cgroup = None
+        self.player_cache.clear_online()
+        self.set_state("stopped")
+
+    def set_state(self, state: str):
+        self.state = state
+        for listener in list(self.state_listeners):
+            listener(self, state)
 
     def start(self) -> bool:
         if self.server_manager_data.installed and self.pid == 0:
             print(self.path_data.jar_path)
-            self.pid = self.process_handler.start_process(
-                ["java", f"-Xmx{self.hardware_config.ram}M", f"-Xms{self.hardware_config.ram}M", "-jar",
-                 self.path_data.jar_path, "--nogui"], cwd=self.path_data.base_path)
+            self._enable_rcon()
+            jvm_config = get_config()["jvm"]
+            if self.cpu_placer is not None:
+                self.cpu_affinity = self.cpu_placer.place(self.id, self.hardware_config.cpu_cores,
+                                                          self.hardware_config.ram)
+            try:
+                command = build_command(jvm_config["java"], self.path_data.jar_path, self.hardware_config.ram,
+                                        self.hardware_config.jvm_profile, len(self.cpu_affinity),
+                                        jvm_config["large_pages"], jvm_config["profiles"])
+                self.pid = self.process_handler.start_process(command, cwd=self.path_data.base_path)
+            except Exception:
+                # e.g. java is missing, the server stays stopped
+                self.pid = 0
+                if self.cpu_placer is not None:
+                    self.cpu_placer.release(self.id)
+                    self.cpu_affinity = []
+                raise
+            self.set_state("starting")
+            process = self.process_handler.get_process(self.pid)
+            if process is None:
+                # the asyncio backend forgets processes as soon as they exited, e.g. on a bad JVM flag
+                self._handle_exit()
+                return False
+            if self.cpu_affinity:
+                try:
+                    self.cpu_placer.pin(self.pid, self.cpu_affinity)
+                except (psutil.Error, OSError) as e:
+                    print(f"Couldn't pin server {self.id} to cores {self.cpu_affinity}: {e}")
+            process.metrics_history = self.metrics_history
+            if self.cgroups is not None:
+                try:
+                    self.cgroup = self.cgroups.create(self, self.pid)
+                    process.cgroup = self.cgroup
+                except OSError as e:
+                    print(f"Couldn't limit server {self.id} with a cgroup: {e}")
+            self.player_cache.clear_online()
+            process.output_listeners.append(self.console_log.append)
+            process.event_listeners.append(self._handle_event)
+            if process.poll() is not None:
+                # exited before the listeners were registered
+                self._handle_exit()
             print("Starting")
-            self.starting = True
             return True
         else:
             return False
 
     def stop(self) -> bool:
-        if self.pid != 0:
-            if not self.stopping:
-                self.process_handler.send_input(self.pid, "stop\n")
-                self.stopping = True
-                return True
-            else:
-                return False
+        if self.state in ("starting", "running"):
+            self.process_handler.send_input(self.pid, "stop\n")
+            self.set_state("stopping")
+            return True
         else:
             return False
 
-    def player_command(self, player: str, command: str) -> bool:
+    def _enable_rcon(self):
+        """
+        Turn on RCON for servers installed before it was enabled at install
+        """
+        # vanilla writes enable-rcon=false and an empty password on its first start
+        if self.server_properties.get("enable-rcon") != "true" or not self.server_properties.get("rcon.password"):
+            self.server_properties["enable-rcon"] = "true"
+            self.server_properties["rcon.port"] = utils.get_free_port()
+            self.server_properties["rcon.password"] = secrets.token_urlsafe(16)
+            self.save_properties()
+
+    def run_commands(self, commands: List[str]) -> Optional[List[str]]:
+        """
+        Run console commands, over one RCON connection if possible
+        :param commands: the commands without leading slash
+        :return: the server's response to each command, None if the server is not running.
+                 Responses are empty if RCON is not available and the commands were written to stdin instead.
+        """
+        if self.get_status() != "running":
+            return None
+        if self.rcon is not None:
+            try:
+                return self.rcon.commands(commands)
+            except (OSError, RconError) as e:
+                print(f"RCON failed, falling back to stdin: {e}")
+        for command in commands:
+            self.process_handler.send_input(self.pid, f"{command}\n")
+        return [""] * len(commands)
+
+    def flush_world(self, timeout: float) -> bool:
+        """
+        Turn off autosaving and write the whole world to disk, until resume_saving is called the world files
+        don't change
+        :param timeout: seconds to wait for the server to finish saving
+        :return: whether the world was saved
+        """
+        self._saved.clear()
+        responses = self.run_commands(["save-off", "save-all flush"])
+        if responses is None:
+            return False
+        # over RCON the response comes after saving, otherwise the console says when it's done
+        return "Saved the game" in responses[1] or self._saved.wait(timeout)
+
+    def resume_saving(self):
+        self.run_commands(["save-on"])
+
+    def player_command(self, player: str, command: str) -> Tuple[bool, str]:
         """
         Perform actions on the server that require a command followed by a player name
         :param player: the player's name
         :param command: the command to execute, such as /ban or /kick
-        :return:
+        :return: whether the command succeeded and the server's response
         """
-        if self.get_status() == "running":
-            self.process_handler.send_input(self.pid, f"{command} {player}\n")
-            return True
-        else:
-            return False
+        responses = self.run_commands([f"{command} {player}"])
+        if responses is None:
+            return False, ""
+        response = responses[0].strip()
+        return not response.startswith(FAILURE_RESPONSES), response
 
     def get_status(self) -> str:
-        if self.pid != 0:
-            if self.starting:
-                return "starting"
-            elif self.stopping:
-                return "stopping"
-            else:
-                return "running"
-        elif not self.server_manager_data.installed:
+        if self.pid == 0 and not self.server_manager_data.installed:
             return "installing"
-        else:
-            return "stopped"
+        return self.state
 
     def get_server_stats(self):
+        """
+        Ping the server, this blocks until the server answered or the status timeout passed
+        :return:
+        """
         if self.get_status() == "running" and self.mcstatus_server is not None:
             status = self.mcstatus_server.status()
+            self.metrics_history.set_ping(status.latency)
             return {
                 "ping": status.latency,
                 "players": status.players.online
@@ -232,15 +362,37 @@ class MinecraftServer:
                 data["op"].append(player)
         return data
 
-    def __dict__(self):
+    def get_config_data(self) -> dict:
+        """
+        Get everything needed to load this server again, without any live status
+        """
         return {
+            "id": self.id,
+            "name": self.name,
+            "network_config": self.network_config.__dict__,
+            "hardware_config": self.hardware_config.__dict__,
+            "hibernation_config": self.hibernation_config.__dict__,
+            "path_data": self.path_data.__dict__,
+            "server_manager_data": self.server_manager_data.__dict__
+        }
+
+    def __dict__(self):
+        data = {
             "id": self.id,
             "name": self.name,
             "status": self.get_status(),
             "network_config": self.network_config.__dict__,
             "hardware_config": self.hardware_config.__dict__,
+            "hibernation_config": self.hibernation_config.__dict__,
             "path_data": self.path_data.__dict__,
             "server_manager_data": self.server_manager_data.__dict__,
-            "server_properties": self.server_properties,
-            "online_stats": self.get_server_stats()
+            # the rcon password gives full control over the server
+            "server_properties": {key: value for key, value in self.server_properties.items()
+                                  if key != "rcon.password"},
+            "online_stats": self.online_stats,
+            "last_crash": self.last_crash,
+            "cpu_affinity": self.cpu_affinity
         }
+        if data["status"] == "installing":
+            data["install_progress"] = self.install_progress.__dict__
+        return data
@@ -1,22 +1,115 @@
+import json
+import os
+import re
+import time
+from threading import Thread, Lock
+from typing import Optional
+
 import requests
 from bs4 import BeautifulSoup
 
+from config import get_config
+
+SHA1_PATTERN = re.compile(r"/([0-9a-f]{40})/")
+
 
 class AvailableMinecraftServerVersions:
+    """
+    Catalog of installable Minecraft server versions.
+
+    The catalog is kept in a cache file and only scraped from mcversions.net again in the background once it
+    is older than the configured ttl, so starting the app doesn't need network access. Download links (and
+    the jar's sha1 where the link contains it) are cached per version as well.
+    """
 
     def __init__(self):
+        self.cache_file: str
+        self.ttl: float
+        self.timeout: float
         self.available_versions = {}
-        self._get_available_minecraft_versions()  # load on init
-        print(self.available_versions)
+        self.download_links = {}
+        self.updated_at = 0
+        self._lock = Lock()
+        # the refresh thread and install jobs save the cache, one at a time as they share the tmp file
+        self._save_lock = Lock()
+
+        self.load_config()
+        self._load_cache()
+        print(f"{len(self.available_versions)} cached minecraft versions")
+        self._refresh_thread = Thread(target=self._refresh_loop, daemon=True)
+        self._refresh_thread.start()
+
+    def load_config(self):
+        config = get_config()["versions"]
+
+        self.cache_file = config["cache_file"]
+        self.ttl = config["ttl"]
+        self.timeout = config["timeout"]
+
+    def _load_cache(self):
+        if os.path.isfile(self.cache_file):
+            try:
+                with open(self.cache_file, "r") as f:
+                    data = json.load(f)
+                self.available_versions = data["versions"]
+                self.download_links = data["download_links"]
+                self.updated_at = data["updated_at"]
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Ignoring broken version cache: {e}")
+
+    def _save_cache(self):
+        with self._save_lock:
+            with self._lock:
+                data = {
+                    "updated_at": self.updated_at,
+                    "versions": self.available_versions,
+                    # get_download_info adds links while this is written
+                    "download_links": dict(self.download_links)
+                }
+            cache_dir = os.path.dirname(self.cache_file)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            tmp_file = f"{self.cache_file}.tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.cache_file)
+
+    def is_expired(self) -> bool:
+        return time.time() - self.updated_at > self.ttl
+
+    def _refresh_loop(self):
+        while True:
+            delay = self.ttl
+            if self.is_expired():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Failed to refresh minecraft versions: {e}")
+                    delay = min(self.ttl, 300)
+            else:
+                delay = self.ttl - (time.time() - self.updated_at)
+            time.sleep(max(delay, 1))
 
     def _get_webpage(self, url):
         headers = {
             "User-Agent": "Mozilla/5.0 (X11; Linux i686; rv:96.0) Gecko/20100101 Firefox/96.0"
         }
-        return requests.get(url, headers=headers).text
+        return requests.get(url, headers=headers, timeout=self.timeout).text
 
-    def _get_available_minecraft_versions(self):
+    def refresh(self):
+        """
+        Scrape the list of available versions again and save it to the cache file
+        """
+        versions = self._get_available_minecraft_versions()
+        with self._lock:
+            self.available_versions = versions
+            self.download_links = {version: link for version, link in self.download_links.items()
+                                   if version in versions}
+            self.updated_at = time.time()
+        self._save_cache()
 
+    def _get_available_minecraft_versions(self) -> dict:
+        versions = {}
         webpage = self._get_webpage("https://mcversions.net")
         soup = BeautifulSoup(webpage, "html.parser")
         releases = soup.find_all("div",
@@ -27,14 +120,33 @@ class AvailableMinecraftServerVersions:
                     and version_link != "/download/1.1" and not version_link.startswith("/download/1.0") \
                     and not version_link.startswith("/download/c") and not version_link.startswith("/download/rd") \
                     and not version_link.startswith("/download/inf"):
-                self.available_versions[version.get("id")] = "https://mcversions.net" \
-                                                             + version.find("a", text="Download").get("href")
+                versions[version.get("id")] = "https://mcversions.net" + version_link
+        return versions
 
-    def get_download_link(self, version:str):
-        url = self.available_versions[version]
-        webpage = self._get_webpage(url)
-        soup = BeautifulSoup(webpage, "html.parser")
-        download_button = soup.find("a", text="Download Server Jar")
-        download_link = download_button.get("href")
-        print(download_button.get("download"))
-        return download_link
+    def get_download_info(self, version: str) -> dict:
+        """
+        Get the server jar download link of a version, scraping its page only the first time
+        :param version: the minecraft version
+        :return: dict with the download url and the jar's sha1 (None if unknown)
+        """
+        info = self.download_links.get(version)
+        if info is None:
+            webpage = self._get_webpage(self.available_versions[version])
+            soup = BeautifulSoup(webpage, "html.parser")
+            download_button = soup.find("a", text="Download Server Jar")
+            download_link = download_button.get("href")
+            match = SHA1_PATTERN.search(download_link)
+            info = {
+                "url": download_link,
+                "sha1": match.group(1) if match is not None else None
+            }
+            with self._lock:
+                self.download_links[version] = info
+            self._save_cache()
+        return info
+
+    def get_download_link(self, version: str) -> str:
+        return self.get_download_info(version)["url"]
+
+    def get_sha1(self, version: str) -> Optional[str]:
+        return self.get_download_info(version)["sha1"]
@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Optional, Dict
+
+
+@dataclass
+class Player:
+    name: str
+    is_online: bool = False
+    is_op: Optional[bool] = False
+    is_banned: Optional[bool] = False
+    ban_reason: Optional[str] = None
+    ban_since: Optional[str] = None
+
+
+class PlayerCache:
+    """
+    Player state of a single server.
+
+    banned-players.json and ops.json are only parsed again when their mtime or size changed. Online players
+    are tracked from the player join and leave console events instead of querying the server.
+    """
+
+    def __init__(self, base_path: str):
+        self.banned_players_file = os.path.join(base_path, "banned-players.json")
+        self.op_players_file = os.path.join(base_path, "ops.json")
+        self.online = set()
+        self._banned = {}
+        self._ops = set()
+        self._file_stats = {}
+        self._players = None
+        self._lock = threading.Lock()
+
+    def _file_changed(self, path: str) -> bool:
+        try:
+            stat = os.stat(path)
+            file_stat = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            file_stat = None
+        if self._file_stats.get(path, False) == file_stat:
+            return False
+        self._file_stats[path] = file_stat
+        return True
+
+    @staticmethod
+    def _load(path: str) -> list:
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def refresh(self):
+        """
+        Reload the player files that changed since the last call
+        """
+        if self._file_changed(self.banned_players_file):
+            banned = {player["name"]: player for player in self._load(self.banned_players_file)}
+            with self._lock:
+                self._banned = banned
+                self._players = None
+        if self._file_changed(self.op_players_file):
+            ops = {player["name"] for player in self._load(self.op_players_file)}
+            with self._lock:
+                self._ops = ops
+                self._players = None
+
+    def set_online(self, name: str, online: bool):
+        with self._lock:
+            if online:
+                self.online.add(name)
+            else:
+                self.online.discard(name)
+            self._players = None
+
+    def clear_online(self):
+        with self._lock:
+            if self.online:
+                self.online = set()
+                self._players = None
+
+    @property
+    def players(self) -> Dict[str, Player]:
+        with self._lock:
+            if self._players is None:
+                players = {}
+                for name in self.online:
+                    players[name] = Player(name, is_online=True)
+                for name, data in self._banned.items():
+                    player = players.setdefault(name, Player(name))
+                    player.is_banned = True
+                    player.ban_reason = data.get("reason")
+                    player.ban_since = data.get("created")
+                for name in self._ops:
+                    players.setdefault(name, Player(name)).is_op = True
+                self._players = players
+            return self._players
@@ -1,59 +1,113 @@
-import asyncio
 import subprocess
 import time
 from threading import Thread
 from typing import List
 
 import psutil
-from fastapi import WebSocket
 
+from api.console_parser import ConsoleParser, ConsoleEvent, EXITED
+from api.data_hub import DataHub
+from api.log_buffer import LogBuffer
+from api.resource_sampler import ResourceSampler
+from api.tick_health import TickHealth
+from config import get_config
 
-class ServerProcess(psutil.Popen):
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.stdout_since_last_send = ""
-        self.logs = ""
+class ProcessOutputMixin:
+    """
+    Console output and resource usage handling shared by all process backends
+    """
+
+    def _init_output(self):
+        self.logs = LogBuffer(get_config()["logs"]["buffer_size"])
+        self.hub = DataHub(self.logs)
         self.data = {}
         self.num_cpus = psutil.cpu_count()
-        self.stop = False
-
-    def add_websocket(self, websocket: WebSocket):
-        self.data_stream.add_websocket(websocket)
-
-    def read_output(self):
-        print("start read")
-        while not self.stop:
-            output = self.stdout.readline()
-            if output:
-                print(output)
-                self.stdout_since_last_send += output
-                self.logs += output
-
-    def update_resource_usage(self):
-        memory_system = psutil.virtual_memory()
-        memory_server = self.memory_full_info()
+        self.metrics_history = None
+        # the server's Cgroup, usage is read from it instead of psutil if set
+        self.cgroup = None
+        self.output_listeners = []
+        self.event_listeners = []
+        self.parser = ConsoleParser()
+        tick_config = get_config()["tick_health"]
+        self.tick_health = TickHealth(tick_config["window"], tick_config["alert_ms"], tick_config["alert_events"],
+                                      tick_config["cooldown"])
+
+    def handle_output(self, output: str):
+        print(output)
+        self.logs.append(output)
+        for listener in self.output_listeners:
+            listener(output)
+        self.hub.publish_output()
+        event = self.parser.parse(output)
+        if event is not None:
+            self.emit_event(event)
+            if event.type == "cant_keep_up":
+                alert = self.tick_health.record(int(event.data["ms_behind"]), int(event.data["ticks_behind"]))
+                if alert is not None:
+                    self.emit_event(ConsoleEvent("lag_alert", event.line, alert))
+
+    def emit_event(self, event: ConsoleEvent):
+        for listener in self.event_listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"Failed to handle {event.type} event: {e}")
+        self.hub.publish_event(event.to_dict())
+
+    def handle_exit(self, returncode: int):
+        self.emit_event(ConsoleEvent(EXITED, data={"returncode": returncode}))
+
+    def update_resource_usage(self, memory_system, use_uss: bool = False):
+        """
+        Sample this process' cpu and memory usage, from its cgroup if it has one
+        :param memory_system: result of psutil.virtual_memory(), shared between all processes sampled at once
+        :param use_uss: report the unique set size instead of the resident set size, this is a lot slower
+        :return:
+        """
+        cpu_percent = None
+        if self.cgroup is not None:
+            try:
+                cpu_percent, memory_server = self.cgroup.sample()
+            except (OSError, ValueError) as e:
+                print(f"Couldn't read cgroup {self.cgroup.path}, falling back to psutil: {e}")
+                self.cgroup = None
+        if cpu_percent is None:
+            with self.oneshot():
+                cpu_percent = self.cpu_percent() / self.num_cpus
+                memory_server = self.memory_full_info().uss if use_uss else self.memory_info().rss
+        if self.metrics_history is not None:
+            self.metrics_history.record(cpu_percent, memory_server)
         self.data = {
             "cpu": {
-                "percent": round(self.cpu_percent() / self.num_cpus, 2)
+                "percent": round(cpu_percent, 2)
             },
             "memory": {
                 "total": memory_system.total,
                 "used": memory_system.used,
-                "server": memory_server.uss
+                "server": memory_server
             },
-            "full_log": False
+            "tick": self.tick_health.snapshot()
         }
+        self.hub.publish_metrics(self.data)
 
-    async def get_data(self):
-        self.data["stdout"] = self.stdout_since_last_send
-        self.stdout_since_last_send = ""
-        return self.data
 
-    def send_data(self):
-        self.data["stdout"] = self.stdout_since_last_send
-        self.data_stream.send_data(self.data)
-        self.stdout_since_last_send = ""
+class ServerProcess(ProcessOutputMixin, psutil.Popen):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._init_output()
+        self.stop = False
+
+    def read_output(self):
+        print("start read")
+        while not self.stop:
+            output = self.stdout.readline()
+            if not output:
+                # end of file, the process exited
+                break
+            self.handle_output(output)
+        self.handle_exit(self.wait())
 
 
 class ProcessHandler(Thread):
@@ -64,6 +118,8 @@ class ProcessHandler(Thread):
         super().__init__(target=self.run)
         self.daemon = True
         self.stop = False
+        config = get_config()["monitoring"]
+        self.sampler = ResourceSampler(config["interval"], config["jitter"], config["uss"])
 
     def get_process(self, pid: int):
         return self.processes.get(pid)
@@ -95,17 +151,12 @@ class ProcessHandler(Thread):
             process.stdin.flush()
 
     def run(self) -> None:
-        start_time = time.time()
         while not self.stop:
             time.sleep(0.1)
             for pid in list(self.processes.keys()):
-                if psutil.pid_exists(pid):
-                    process = self.processes[pid]
-                    if time.time() - start_time > 3:
-                        process.update_resource_usage()
-                        start_time = time.time()
-
-                else:
+                if not psutil.pid_exists(pid):
+                    self.processes[pid].hub.close()
                     self.threads[pid].stop = True
                     del self.threads[pid]
                     del self.processes[pid]
+            self.sampler.sample(self.processes)
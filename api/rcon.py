@@ -0,0 +1,165 @@
+import itertools
+import socket
+import struct
+from contextlib import contextmanager
+from queue import Queue, Empty
+from threading import Lock
+from typing import List
+
+TYPE_RESPONSE = 0
+TYPE_COMMAND = 2
+TYPE_LOGIN = 3
+
+# responses to commands that didn't do anything, used to report player commands as failed
+FAILURE_RESPONSES = (
+    "No player was found",
+    "That player does not exist",
+    "Nothing changed",
+    "Unknown or incomplete command",
+    "Incorrect argument",
+    "Invalid IP address",
+    "Could not",
+)
+
+
+class RconError(Exception):
+    pass
+
+
+class RconConnection:
+    """
+    A single authenticated RCON connection.
+
+    Every command is followed by an empty packet of an unknown type. The server answers those in order, so the
+    answer to it marks the end of the command's (possibly fragmented) response.
+    """
+
+    def __init__(self, host: str, port: int, password: str, timeout: float = 5):
+        self._ids = itertools.count(1)
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        try:
+            request_id = self._send(TYPE_LOGIN, password)
+            response_id, _, _ = self._receive()
+            if response_id == -1 or response_id != request_id:
+                raise RconError("RCON authentication failed")
+        except Exception:
+            self.close()
+            raise
+
+    def _send(self, packet_type: int, payload: str) -> int:
+        request_id = next(self._ids)
+        data = struct.pack("<ii", request_id, packet_type) + payload.encode() + b"\x00\x00"
+        self._socket.sendall(struct.pack("<i", len(data)) + data)
+        return request_id
+
+    def _read_exactly(self, length: int) -> bytes:
+        data = b""
+        while len(data) < length:
+            chunk = self._socket.recv(length - len(data))
+            if not chunk:
+                raise RconError("RCON connection closed")
+            data += chunk
+        return data
+
+    def _receive(self):
+        length, = struct.unpack("<i", self._read_exactly(4))
+        data = self._read_exactly(length)
+        request_id, packet_type = struct.unpack("<ii", data[:8])
+        return request_id, packet_type, data[8:-2].decode(errors="replace")
+
+    def command(self, command: str) -> str:
+        """
+        Run a command and return the server's response
+        """
+        request_id = self._send(TYPE_COMMAND, command)
+        end_id = self._send(TYPE_RESPONSE, "")
+        response = []
+        while True:
+            response_id, _, payload = self._receive()
+            if response_id == end_id:
+                break
+            if response_id == request_id:
+                response.append(payload)
+        return "".join(response)
+
+    def close(self):
+        try:
+            self._socket.close()
+        except OSError:
+            pass
+
+
+class RconPool:
+    """
+    Keeps up to size open RCON connections to one server and hands them out to callers
+    """
+
+    def __init__(self, host: str, port: int, password: str, size: int = 2, timeout: float = 5):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.size = size
+        self.timeout = timeout
+        self._idle = Queue()
+        self._open = 0
+        self._lock = Lock()
+        self.closed = False
+
+    @contextmanager
+    def connection(self):
+        connection = self._acquire()
+        try:
+            yield connection
+        except (OSError, RconError):
+            # don't hand out connections in an unknown state again
+            connection.close()
+            with self._lock:
+                self._open -= 1
+            raise
+        else:
+            if self.closed:
+                connection.close()
+            else:
+                self._idle.put(connection)
+
+    def _acquire(self) -> RconConnection:
+        if self.closed:
+            raise RconError("RCON pool is closed")
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+        with self._lock:
+            create = self._open < self.size
+            if create:
+                self._open += 1
+        if not create:
+            try:
+                return self._idle.get(timeout=self.timeout)
+            except Empty:
+                raise RconError("No RCON connection available")
+        try:
+            return RconConnection(self.host, self.port, self.password, self.timeout)
+        except Exception:
+            with self._lock:
+                self._open -= 1
+            raise
+
+    def command(self, command: str) -> str:
+        with self.connection() as connection:
+            return connection.command(command)
+
+    def commands(self, commands: List[str]) -> List[str]:
+        """
+        Run several commands over the same connection
+        """
+        with self.connection() as connection:
+            return [connection.command(command) for command in commands]
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
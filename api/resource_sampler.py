@@ -0,0 +1,54 @@
+import random
+import time
+
+import psutil
+
+
+class ResourceSampler:
+    """
+    Samples resource usage of server processes, each on its own schedule.
+
+    Every process gets sampled every interval seconds (+/- jitter, so servers started together don't stay
+    in lockstep). System wide numbers are read once per tick and shared by all processes sampled in it.
+    USS needs a full walk of the process' memory maps, so the cheaper RSS is used unless use_uss is set.
+    """
+
+    def __init__(self, interval: float = 3, jitter: float = 0.5, use_uss: bool = False):
+        self.interval = interval
+        self.jitter = jitter
+        self.use_uss = use_uss
+        self._next_sample = {}
+
+    def _schedule(self, pid: int, now: float):
+        self._next_sample[pid] = now + self.interval + random.uniform(-self.jitter, self.jitter)
+
+    def sample(self, processes: dict) -> float:
+        """
+        Sample all processes that are due
+        :param processes: dict of pid -> process to sample
+        :return: seconds until the next process is due
+        """
+        now = time.monotonic()
+        for pid in list(self._next_sample):
+            if pid not in processes:
+                del self._next_sample[pid]
+        due = []
+        for pid in list(processes):
+            if pid not in self._next_sample:
+                # first sample soon after start, spread over the jitter window
+                self._next_sample[pid] = now + random.uniform(0, self.jitter)
+            elif self._next_sample[pid] <= now:
+                due.append(pid)
+        if due:
+            memory_system = psutil.virtual_memory()
+            for pid in due:
+                process = processes.get(pid)
+                if process is not None:
+                    try:
+                        process.update_resource_usage(memory_system, self.use_uss)
+                    except psutil.Error:
+                        pass
+                self._schedule(pid, now)
+        if not self._next_sample:
+            return self.interval
+        return max(min(self._next_sample.values()) - time.monotonic(), 0)
@@ -1,18 +1,46 @@
 import os
-import json
 import random
+import re
 import shutil
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from threading import Thread
-from typing import Tuple
+from threading import Lock
+from typing import Tuple, Optional, List, AsyncIterator, Iterator
+
+import psutil
 
 from api import utils
 from api.minecraft_server_versions import AvailableMinecraftServerVersions
+from api.async_process_handler import AsyncProcessHandler
+from api.backups import BackupManager
+from api.cgroups import CgroupManager
+from api.cpu_placement import CpuPlacer
+from api.hibernation import Hibernator
+from api.install_jobs import InstallJobScheduler, InstallJob
+from api.jar_store import JarStore
+from api.jvm_profiles import get_profiles
+from api.log_search import LogSearcher, compile_query
 from api.process_handler import ProcessHandler
+from api.server_store import ServerStore
+from api.start_scheduler import StartScheduler
+from api.status_prober import StatusProber
+from api.worker_pool import get_worker_pool
 from config import get_config
 from api.minecraft_server import MinecraftServer, MinecraftServerPathData, MinecraftServerNetworkConfig, \
-    MinecraftServerHardwareConfig, MCServerManagerData, MinecraftData
+    MinecraftServerHardwareConfig, MCServerManagerData, MinecraftData, MinecraftServerHibernationConfig, STATUSES
+
+# action_data keys every action needs
+ACTION_DATA_KEYS = {
+    "start": [],
+    "stop": [],
+    "ban": ["player"],
+    "ban-ip": ["ip"],
+    "pardon": ["player"],
+    "pardon-ip": ["ip"],
+    "kick": ["player"],
+    "op": ["player"],
+    "deop": ["player"]
+}
 
 
 class ServerManager:
@@ -24,12 +52,50 @@ class ServerManager:
         #self.build_tools_path: str
         #self.install_logs = ""
 
-        self.process_handler = ProcessHandler()
+        if get_config()["servers"]["process_backend"] == "asyncio":
+            self.process_handler = AsyncProcessHandler()
+        else:
+            self.process_handler = ProcessHandler()
         self.process_handler.start()
+        status_config = get_config()["status"]
+        self.log_searcher = LogSearcher(get_worker_pool())
+        self.status_prober = StatusProber(status_config["ttl"], status_config["timeout"], status_config["workers"])
         self._servers = {}
+        self._reserved_ids = set()
+        # picking and reserving an id for a new server
+        self._ids_lock = Lock()
+        self._action_executor = ThreadPoolExecutor(get_config()["actions"]["workers"], thread_name_prefix="action")
+        scheduler_config = get_config()["scheduler"]
+        self.start_scheduler = StartScheduler(scheduler_config["max_warmups"], scheduler_config["memory_reserve"],
+                                              scheduler_config["retry_interval"], scheduler_config["warmup_timeout"])
+        hibernation_config = get_config()["hibernation"]
+        self.hibernator = Hibernator(lambda server_id: self.start_server(server_id),
+                                     hibernation_config["check_interval"], hibernation_config["host"])
+        self.hibernator.start()
+        self.cpu_placer = None
+        if get_config()["placement"]["enabled"]:
+            if CpuPlacer.is_supported():
+                self.cpu_placer = CpuPlacer()
+            else:
+                print("CPU placement is not supported on this platform")
+        backup_config = get_config()["backups"]
+        self.backups = BackupManager(get_worker_pool(), backup_config["path"], backup_config["compress_level"],
+                                     backup_config["keep_last"], backup_config["keep_daily"],
+                                     backup_config["keep_weekly"], backup_config["save_timeout"])
+        self.cgroups = None
+        cgroups_config = get_config()["cgroups"]
+        if cgroups_config["enabled"]:
+            cgroups = CgroupManager(cgroups_config["path"], psutil.cpu_count(), cgroups_config["memory_overhead"],
+                                    cgroups_config["min_overhead"])
+            if cgroups.setup():
+                self.cgroups = cgroups
 
 
         self.load_config()
+        self.jar_store = JarStore(server_versions, get_config()["jars"]["path"])
+        jobs_config = get_config()["jobs"]
+        self.install_jobs = InstallJobScheduler(jobs_config["workers"], jobs_config["per_host"],
+                                                jobs_config["history"])
         self.load_servers()
 
     def load_config(self):
@@ -37,53 +103,80 @@ class ServerManager:
 
         self.base_path = config["path"]
         self.servers_path = os.path.join(self.base_path, "servers")
+        self.server_store = ServerStore(os.path.join(self.servers_path, "servers.json"), config["save_delay"])
 
     def load_servers(self):
-        file_location = os.path.join(self.servers_path, "servers.json")
-        if os.path.isfile(file_location):
-            with open(file_location, "r") as f:
-                data = json.load(f)
-            servers = data["servers"]
-            for server_id in servers:
-                server_data = servers[server_id]
-                print(server_data)
-                network_config = MinecraftServerNetworkConfig(**server_data["network_config"])
-                hardware_config = MinecraftServerHardwareConfig(**server_data["hardware_config"])
-                path_data = MinecraftServerPathData(**server_data["path_data"])
-                server_manager_data = MCServerManagerData(**server_data["server_manager_data"])
-                server_id = server_data["id"]
-                server = MinecraftServer(server_id, server_data["name"], self.process_handler, path_data, network_config,
-                                         hardware_config, server_manager_data, self.available_versions)
-                server.load_properties()
-                self._servers[server_id] = server
-
-    def save_servers(self):
-        server_data = self.get_all_server_data()
-        save = {
-            "servers": server_data
-        }
-        with open(os.path.join(self.servers_path, "servers.json"), "w") as f:
-            json.dump(save, f, default=str, indent=4)
+        servers = self.server_store.load()
+        for server_id in servers:
+            server_data = servers[server_id]
+            print(server_data)
+            network_config = MinecraftServerNetworkConfig(**server_data["network_config"])
+            hardware_config = MinecraftServerHardwareConfig(**server_data["hardware_config"])
+            path_data = MinecraftServerPathData(**server_data["path_data"])
+            server_manager_data = MCServerManagerData(**server_data["server_manager_data"])
+            hibernation_config = MinecraftServerHibernationConfig(**server_data.get("hibernation_config", {}))
+            server_id = server_data["id"]
+            server = MinecraftServer(server_id, server_data["name"], self.process_handler, path_data, network_config,
+                                     hardware_config, server_manager_data, self.available_versions,
+                                     hibernation_config)
+            server.load_properties()
+            server.cpu_placer = self.cpu_placer
+            server.cgroups = self.cgroups
+            self._servers[server_id] = server
+            self.hibernator.track(server)
+
+    def save_server(self, server: MinecraftServer):
+        """
+        Save the server's configuration, writes are batched and happen in the background
+        """
+        self.server_store.mark_dirty(server)
 
     def server_exists(self, server_id: int) -> bool:
         return server_id in self._servers
 
-    def get_server(self, server_id: int) -> MinecraftServer:
+    def get_server(self, server_id: int, refresh: bool = True) -> MinecraftServer:
         server = self._servers.get(server_id)
-        if server is not None:
+        if server is not None and refresh:
             server.update()
         return server
 
-    def create_server(self, data: dict) -> int:
-        id = 0
-        while id == 0 or id in self._servers:
-            id = random.randint(1000, 9999)
-        print(id)
-        thrd = Thread(target=self._create_server, args=[id, data])
-        thrd.start()
-        return id
+    def create_server(self, data: dict, server_id: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Queue the installation of a new server
+        :param data: the server creation data
+        :param server_id: id for the new server, a random free one is picked if not given
+        :return: the new server's id and the id of its install job
+        """
+        id = server_id or 0
+        with self._ids_lock:
+            if id in self._servers or id in self._reserved_ids:
+                raise ValueError(f"Server {id} already exists")
+            while id == 0 or id in self._servers or id in self._reserved_ids:
+                id = random.randint(1000, 9999)
+            print(id)
+            self._reserved_ids.add(id)
+        try:
+            job = self.install_jobs.submit(id, data["version"], lambda job: self._create_server(id, data, job))
+        except Exception:
+            with self._ids_lock:
+                self._reserved_ids.discard(id)
+            raise
+        return id, job.id
 
-    def _create_server(self, server_id: int, data: dict):
+    def _create_server(self, server_id: int, data: dict, job: InstallJob):
+        try:
+            self._install_server(server_id, data, job)
+        except Exception:
+            # the job shows why it failed, a half created server would stay installing forever
+            with self._ids_lock:
+                self._reserved_ids.discard(server_id)
+                server = self._servers.pop(server_id, None)
+            if server is not None:
+                self.hibernator.untrack(server)
+            shutil.rmtree(os.path.join(self.servers_path, str(server_id)), ignore_errors=True)
+            raise
+
+    def _install_server(self, server_id: int, data: dict, job: InstallJob):
         server_path = os.path.join(self.servers_path, str(server_id))
         if os.path.exists(server_path):
             shutil.rmtree(server_path)
@@ -103,39 +196,79 @@ class ServerManager:
         server_manager_data = MCServerManagerData(installed=False, version=data["version"], created_at=datetime.now())
         server = MinecraftServer(server_id, data["server_name"], self.process_handler, path_data, network_config, hardware_config,
                                  server_manager_data, self.available_versions)
-        self._servers[server_id] = server
-        server.install(minecraft_data)
-        self.save_servers()
+        server.install_progress = job.progress
+        server.cpu_placer = self.cpu_placer
+        server.cgroups = self.cgroups
+        with self._ids_lock:
+            self._servers[server_id] = server
+            self._reserved_ids.discard(server_id)
+        self.hibernator.track(server)
+        version = server_manager_data.version
+        if version not in self.available_versions.available_versions:
+            raise ValueError(f"Minecraft version {version} is not available")
+        job.state = "downloading"
+        if self.jar_store.get(version) is None:
+            with self.install_jobs.host_slot(self.available_versions.get_download_link(version)):
+                self.jar_store.ensure(version, job.progress)
+        job.state = "configuring"
+        server.install(minecraft_data, self.jar_store)
+        self.save_server(server)
 
     def delete_server(self, server_id: int):
         server = self.get_server(server_id)
+        self.start_scheduler.cancel(server_id)
+        self.hibernator.untrack(server)
+        self.backups.remove_server(server_id)
         shutil.rmtree(server.path_data.base_path)
         del self._servers[server_id]
+        self.server_store.remove(server_id)
 
     def update_servers(self):
         for server in self._servers.values():
             server.update()
 
-    def start_server(self, server_id: int) -> Tuple[bool, str]:
-        server = self.get_server(server_id)
+    def start_server(self, server_id: int, refresh: bool = True) -> Tuple[bool, str]:
+        server = self.get_server(server_id, refresh)
         if server is not None:
-            success = server.start()
-            if success:
-                message = "Server started successfully!"
+            status = server.get_status()
+            if status == "installing":
+                success = False
+                message = "Couldn't start server: not installed!"
+            elif status == "queued":
+                success = False
+                message = "Couldn't start server: already queued!"
             else:
-                status = server.get_status()
-                if status == "installing":
-                    message = "Couldn't start server: not installed!"
-                else:
-                    message = "Couldn't start server: already running!"
+                # a restore must not begin between the check and the start
+                with self.backups.start_lock:
+                    success, message = self._submit_start(server)
         else:
             success = False
             message = "Couldn't start server: server does not exist!"
         return success, message
 
-    def stop_server(self, server_id: int) -> Tuple[bool, str]:
-        server = self.get_server(server_id)
+    def _submit_start(self, server: MinecraftServer) -> Tuple[bool, str]:
+        if self.backups.is_busy(server.id):
+            return False, "Couldn't start server: a backup is being taken or restored!"
+        if server.pid != 0:
+            return False, "Couldn't start server: already running!"
+        error = self.start_scheduler.submit(server)
+        status = server.get_status()
+        if status == "queued":
+            return True, "Server start queued until enough memory is available"
+        if error is not None:
+            return False, f"Couldn't start server: {error}"
+        if status in ("starting", "running"):
+            return True, "Server started successfully!"
+        return False, "Couldn't start server: the server exited right away!"
+
+    def stop_server(self, server_id: int, refresh: bool = True) -> Tuple[bool, str]:
+        server = self.get_server(server_id, refresh)
         if server is not None:
+            if self.start_scheduler.cancel(server_id):
+                return True, "Queued server start cancelled"
+            if server.get_status() == "hibernating":
+                self.hibernator.release(server)
+                return True, "Server stopped, it won't wake up on connect anymore"
             success = server.stop()
             if success:
                 message = "Server is stopping"
@@ -150,33 +283,286 @@ class ServerManager:
             message = "Couldn't stop server: server does not exist!"
         return success, message
 
-    def player_command(self, server_id: int, player: str, command: str) -> Tuple[bool, str]:
-        server = self.get_server(server_id)
+    def player_command(self, server_id: int, player: str, command: str, refresh: bool = True) -> Tuple[bool, str]:
+        server = self.get_server(server_id, refresh)
         if server is not None:
-            success = server.player_command(player, command)
+            success, response = server.player_command(player, command)
             if success:
-                message = f"Successfully {command}ed {player}"
+                message = response or f"Successfully {command}ed {player}"
             else:
                 status = server.get_status()
                 if status != "running":
                     message = f"Failed to {command} {player}: server is offline!"
                 else:
-                    message = f"Failed to {command} {player}: unknown error"
+                    message = f"Failed to {command} {player}: {response or 'unknown error'}"
         else:
             success = False
             message = f"Failed to {command} {player}: server does not exist!"
         return success, message
 
+    def perform_action(self, server_id: int, action: str, action_data: Optional[dict] = None,
+                       refresh: bool = True) -> Tuple[bool, str]:
+        """
+        Run one of the actions in ACTION_DATA_KEYS on a server
+        :param server_id: the server to run the action on
+        :param action: the action to run
+        :param action_data: additional data the action needs, e.g. the player to ban
+        :param refresh: whether to update the server's status first
+        :return: whether the action succeeded and a message
+        """
+        if action not in ACTION_DATA_KEYS:
+            return False, f"Unknown action {action}"
+        for key in ACTION_DATA_KEYS[action]:
+            if action_data is None or key not in action_data:
+                return False, "Incorrect action_data to run this command"
+        if action == "start":
+            return self.start_server(server_id, refresh)
+        if action == "stop":
+            return self.stop_server(server_id, refresh)
+        player = action_data[ACTION_DATA_KEYS[action][0]]
+        return self.player_command(server_id, player, action, refresh)
+
+    def _select_servers(self, selector) -> List[int]:
+        """
+        Get the ids of the servers a batch item targets, raises ValueError for unknown servers and statuses
+        :param selector: a server id, "all" or a status like "running"
+        """
+        if isinstance(selector, int):
+            if selector not in self._servers:
+                raise ValueError(f"Server {selector} does not exist")
+            return [selector]
+        if selector == "all":
+            return list(self._servers.keys())
+        if selector not in STATUSES:
+            raise ValueError(f"Unknown server selector {selector}, use a server id, \"all\" or a status")
+        return [server.id for server in list(self._servers.values()) if server.get_status() == selector]
+
+    def run_actions(self, items: List[dict]) -> List[dict]:
+        """
+        Run a batch of actions concurrently. Servers are not updated before each action, their status is
+        kept up to date by their console output anyway.
+        :param items: dicts with the target "server", the "action" and optionally "action_data",
+        see _select_servers for the possible targets
+        :return: the result of every action, in the order of items
+        """
+        # nothing runs if any item is invalid
+        selected = [self._select_servers(item["server"]) for item in items]
+        futures = []
+        for item, server_ids in zip(items, selected):
+            for server_id in server_ids:
+                future = self._action_executor.submit(self.perform_action, server_id, item["action"],
+                                                      item.get("action_data"), False)
+                futures.append((server_id, item["action"], future))
+        results = []
+        for server_id, action, future in futures:
+            try:
+                success, message = future.result()
+            except Exception as e:
+                success, message = False, f"Failed to {action}: {e}"
+            results.append({
+                "server_id": server_id,
+                "action": action,
+                "success": success,
+                "message": message
+            })
+        return results
+
+    def set_hibernation(self, server_id: int, enabled: bool, idle_minutes: int) -> Optional[dict]:
+        """
+        Change when a server is stopped for having no players, see Hibernator
+        :param server_id: the server to change
+        :param enabled: whether the server should hibernate at all
+        :param idle_minutes: minutes without players before the server hibernates
+        :return: the new hibernation config
+        """
+        server = self._servers.get(server_id)
+        if server is None:
+            return None
+        server.hibernation_config = MinecraftServerHibernationConfig(enabled, idle_minutes)
+        if not enabled:
+            self.hibernator.release(server)
+        self.save_server(server)
+        return server.hibernation_config.__dict__
+
+    def set_hardware_config(self, server_id: int, ram: int, jvm_profile: str, cpu_cores: int, cpu_limit: float = 0,
+                            memory_limit: int = 0, io_bps: int = 0) -> Optional[dict]:
+        """
+        Change the resources of a server, they are used from its next start on
+        :param server_id: the server to change
+        :param ram: heap size in MB
+        :param jvm_profile: name of the JVM profile, see get_jvm_profiles
+        :param cpu_cores: number of cores to pin the server to, 0 for a share proportional to ram
+        :param cpu_limit: number of cores the server's cgroup may use, 0 for no limit
+        :param memory_limit: memory limit of the server's cgroup in MB, 0 to derive it from ram
+        :param io_bps: disk read and write limit of the server's cgroup in MB/s, 0 for no limit
+        :return: the new hardware config
+        """
+        server = self._servers.get(server_id)
+        if server is None:
+            return None
+        if jvm_profile not in get_profiles(get_config()["jvm"]["profiles"]):
+            raise ValueError(f"Unknown JVM profile {jvm_profile}")
+        if 0 < memory_limit < ram:
+            raise ValueError("The memory limit must be larger than ram")
+        server.hardware_config = MinecraftServerHardwareConfig(ram, jvm_profile, cpu_cores, cpu_limit, memory_limit,
+                                                               io_bps)
+        self.save_server(server)
+        return server.hardware_config.__dict__
+
+    def get_jvm_profiles(self) -> dict:
+        return get_profiles(get_config()["jvm"]["profiles"])
+
+    def create_backup(self, server_id: int) -> Optional[dict]:
+        """
+        Take a snapshot of a server's world in the background, see BackupManager
+        :return: the backup job, None if the server doesn't exist
+        """
+        server = self._servers.get(server_id)
+        if server is not None:
+            return self.backups.start_backup(server)
+
+    def get_backups(self, server_id: int) -> Optional[dict]:
+        if server_id in self._servers:
+            return {
+                "backups": self.backups.get_backups(server_id),
+                "job": self.backups.get_job(server_id)
+            }
+
+    def restore_backup(self, server_id: int, backup_id: str) -> Optional[dict]:
+        """
+        Replace a stopped server's world with a snapshot in the background
+        :return: the restore job, None if the server doesn't exist
+        """
+        server = self._servers.get(server_id)
+        if server is not None:
+            return self.backups.start_restore(server, backup_id)
+
+    def evict_unused_jars(self) -> List[str]:
+        """
+        Remove all jars from the jar store that no server uses
+        """
+        versions_in_use = {server.server_manager_data.version for server in self._servers.values()}
+        return self.jar_store.evict(versions_in_use)
+
+    def get_server_logs(self, server_id: int, from_line: Optional[int] = None, limit: int = 1000) -> Optional[dict]:
+        server = self._servers.get(server_id)
+        if server is not None:
+            lines, from_line = server.console_log.read(from_line, limit)
+            return {
+                "from_line": from_line,
+                "lines": lines,
+                "next_line": from_line + len(lines),
+                "total_lines": server.console_log.total_lines
+            }
+
+    def search_server_logs(self, server_id: int, query: str, regex: bool = False, since: Optional[float] = None,
+                           limit: int = 1000) -> Iterator[dict]:
+        """
+        Search the console history of a server
+        :param server_id: the server to search
+        :param query: text to search for, or a regular expression if regex is set
+        :param regex: whether query is a regular expression
+        :param since: unix timestamp, only log segments written to after it are searched
+        :param limit: maximum number of matches
+        :return: the matching lines with their line numbers, in order
+        """
+        server = self._servers.get(server_id)
+        if server is None:
+            return iter(())
+        try:
+            pattern = compile_query(query, regex)
+        except re.error as e:
+            raise ValueError(f"Invalid regular expression: {e}")
+        return self.log_searcher.search(server.console_log, pattern, since, limit)
+
+    def get_available_versions(self) -> List[str]:
+        return list(self.available_versions.available_versions.keys())
+
+    def get_players(self, server_id: int) -> Optional[dict]:
+        server = self.get_server(server_id)
+        if server is not None:
+            return server.get_players()
+
+    def get_jars(self) -> List[dict]:
+        return self.jar_store.get_jars()
+
+    def prewarm_jars(self, versions: List[str]) -> dict:
+        return self.jar_store.prewarm(versions)
+
+    def get_jobs(self) -> List[dict]:
+        return [job.to_dict() for job in self.install_jobs.get_jobs()]
+
+    def get_job(self, job_id: int) -> Optional[dict]:
+        job = self.install_jobs.get_job(job_id)
+        if job is not None:
+            return job.to_dict()
+
+    async def subscribe(self, server_id: int, offset: Optional[int] = None) -> AsyncIterator[dict]:
+        """
+        Stream the datastream frames of a running server, see DataHub
+        :param server_id: the server to stream
+        :param offset: line offset to start streaming output from, None streams the whole retained log
+        :return:
+        """
+        server = self.get_server(server_id)
+        if server is None or server.pid == 0:
+            return
+        process = self.process_handler.get_process(server.pid)
+        if process is None:
+            return
+        subscription = process.hub.subscribe(offset)
+        try:
+            while True:
+                frame = await subscription.next_frame()
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            process.hub.unsubscribe(subscription)
+
+    def get_capacity(self) -> dict:
+        """
+        Get the host's resources and what the servers on it use, used to place new servers on fleet nodes
+        """
+        memory = psutil.virtual_memory()
+        running = [server for server in self._servers.values() if server.pid != 0]
+        return {
+            "cpu_count": psutil.cpu_count(),
+            "cpu_percent": psutil.cpu_percent(),
+            "memory_total": memory.total,
+            "memory_available": memory.available,
+            "ram_allocated": sum(server.hardware_config.ram for server in running) * 1024 * 1024,
+            "running_servers": len(running),
+            "server_ids": list(self._servers.keys())
+        }
+
+    def get_start_queue(self) -> dict:
+        """
+        Get the servers waiting to start and the ones still warming up, see StartScheduler
+        """
+        return self.start_scheduler.get_state()
+
     def get_server_ids(self):
         return list(self._servers.keys())
 
     def get_server_data(self, server_id: int) -> dict:
         server = self.get_server(server_id)
         if server is not None:
+            self.status_prober.probe([server])
             return server.__dict__()
 
+    def get_server_metrics(self, server_id: int, start: Optional[float] = None, end: Optional[float] = None,
+                           step: Optional[float] = None) -> Optional[dict]:
+        server = self._servers.get(server_id)
+        if server is not None:
+            return server.metrics_history.query(start, end, step)
+
     def get_all_server_data(self):
+        servers = list(self._servers.values())
+        for server in servers:
+            server.update()
+        self.status_prober.probe(servers)
         data = {}
-        for id in self._servers.keys():
-            data[id] = self.get_server_data(id)
+        for server in servers:
+            data[server.id] = server.__dict__()
         return data
\ No newline at end of file
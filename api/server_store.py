@@ -0,0 +1,83 @@
+import atexit
+import json
+import os
+from threading import Lock, Timer
+
+
+class ServerStore:
+    """
+    Persists the configuration of all servers to servers.json.
+
+    Changed servers are marked dirty and written together once no further change came in for delay seconds.
+    Only dirty servers are serialized again and the file is replaced atomically, so a crash while saving
+    never leaves a half written registry behind.
+    """
+
+    def __init__(self, file_location: str, delay: float = 1):
+        self.file_location = file_location
+        self.delay = delay
+        self._entries = {}
+        self._dirty = {}
+        self._timer = None
+        self._lock = Lock()
+        self._write_lock = Lock()
+        atexit.register(self.flush)
+
+    def load(self) -> dict:
+        """
+        Read servers.json
+        :return: dict of server id -> server data
+        """
+        if not os.path.isfile(self.file_location):
+            return {}
+        with open(self.file_location, "r") as f:
+            data = json.load(f)
+        with self._lock:
+            self._entries = {str(server_id): server for server_id, server in data["servers"].items()}
+        return data["servers"]
+
+    def mark_dirty(self, server: "MinecraftServer"):
+        """
+        Save the server's configuration with the next write
+        """
+        with self._lock:
+            self._dirty[str(server.id)] = server
+            self._schedule()
+
+    def remove(self, server_id: int):
+        with self._lock:
+            self._dirty.pop(str(server_id), None)
+            self._entries.pop(str(server_id), None)
+            self._schedule()
+
+    def _schedule(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = Timer(self.delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """
+        Write all pending changes now
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                dirty, self._dirty = self._dirty, {}
+                for server_id, server in dirty.items():
+                    self._entries[server_id] = server.get_config_data()
+                save = {
+                    "servers": dict(self._entries)
+                }
+            directory = os.path.dirname(self.file_location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_file = f"{self.file_location}.tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(save, f, default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.file_location)
@@ -0,0 +1,145 @@
+import time
+from collections import deque
+from threading import Thread, Lock, Event
+from typing import Dict, Optional
+
+import psutil
+
+
+class StartScheduler:
+    """
+    Admission control for server starts.
+
+    Starts wait in a queue until the host has enough memory available for the server's heap and fewer than
+    max_warmups servers are still warming up, i.e. haven't printed their "Done" line yet. Starts are admitted in
+    order, so a big server at the front of the queue isn't starved by smaller ones behind it. The queue is
+    retried whenever a warm-up ends and every retry_interval seconds, as memory can also be freed by other
+    processes. Servers that don't finish warming up within warmup_timeout seconds stop counting against
+    max_warmups.
+    """
+
+    def __init__(self, max_warmups: int = 2, memory_reserve: int = 512, retry_interval: float = 5,
+                 warmup_timeout: float = 300):
+        self.max_warmups = max_warmups
+        # MB always left free for the system
+        self.memory_reserve = memory_reserve
+        self.retry_interval = retry_interval
+        self.warmup_timeout = warmup_timeout
+        self._queue = deque()
+        self._queued_at: Dict[int, float] = {}
+        self._warming: Dict[int, tuple] = {}
+        # why the last start of a server failed, a failed start must not end the scheduler thread
+        self._start_errors: Dict[int, str] = {}
+        self._lock = Lock()
+        self._wake = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, server: "MinecraftServer") -> Optional[str]:
+        """
+        Queue a start and start as many queued servers as possible right away, the server's status tells
+        whether it started or is still queued
+        :return: why the server couldn't be started if starting it right away failed
+        """
+        with self._lock:
+            self._start_errors.pop(server.id, None)
+            server.set_state("queued")
+            self._queue.append(server)
+            self._queued_at[server.id] = time.time()
+            self._dispatch()
+            return self._start_errors.pop(server.id, None)
+
+    def cancel(self, server_id: int) -> bool:
+        """
+        Remove a server from the queue
+        :return: whether the server was queued
+        """
+        with self._lock:
+            for server in self._queue:
+                if server.id == server_id:
+                    self._queue.remove(server)
+                    del self._queued_at[server_id]
+                    server.set_state("stopped")
+                    return True
+        return False
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.retry_interval)
+            self._wake.clear()
+            with self._lock:
+                self._dispatch()
+
+    def _on_state(self, server: "MinecraftServer", state: str):
+        # called from the server's process handler, which must not wait for the lock while a start is
+        # running, so the warm-up is only finished on the scheduler thread
+        if state != "starting":
+            self._wake.set()
+
+    def _finish_warmup(self, server: "MinecraftServer"):
+        if self._warming.pop(server.id, None) is not None:
+            server.state_listeners.remove(self._on_state)
+
+    def _pending_memory(self) -> int:
+        """
+        Memory the warming servers will still allocate for their heaps, in bytes
+        """
+        pending = 0
+        for server, _ in self._warming.values():
+            ram = server.hardware_config.ram * 1024 * 1024
+            try:
+                pending += max(ram - psutil.Process(server.pid).memory_info().rss, 0)
+            except psutil.Error:
+                pending += ram
+        return pending
+
+    def _fits(self, server: "MinecraftServer") -> bool:
+        available = psutil.virtual_memory().available - self._pending_memory() - self.memory_reserve * 1024 * 1024
+        return server.hardware_config.ram * 1024 * 1024 <= available
+
+    def _dispatch(self):
+        now = time.time()
+        for server, started_at in list(self._warming.values()):
+            if server.state != "starting":
+                self._finish_warmup(server)
+            elif now - started_at > self.warmup_timeout:
+                print(f"Server {server.id} didn't finish starting within {self.warmup_timeout}s")
+                self._finish_warmup(server)
+        while self._queue and len(self._warming) < self.max_warmups:
+            server = self._queue[0]
+            if not self._fits(server):
+                break
+            self._queue.popleft()
+            del self._queued_at[server.id]
+            server.set_state("stopped")
+            server.state_listeners.append(self._on_state)
+            self._warming[server.id] = (server, now)
+            try:
+                started = server.start()
+            except Exception as e:
+                print(f"Couldn't start server {server.id}: {e}")
+                self._start_errors[server.id] = f"{type(e).__name__}: {e}"
+                started = False
+            if not started or server.get_status() != "starting":
+                self._finish_warmup(server)
+
+    def get_state(self) -> dict:
+        with self._lock:
+            queued = [{
+                "server_id": server.id,
+                "ram": server.hardware_config.ram,
+                "queued_at": self._queued_at[server.id]
+            } for server in self._queue]
+            warming = [{
+                "server_id": server.id,
+                "ram": server.hardware_config.ram,
+                "started_at": started_at
+            } for server, started_at in self._warming.values()]
+            pending = self._pending_memory()
+        return {
+            "max_warmups": self.max_warmups,
+            "memory_available": psutil.virtual_memory().available,
+            "memory_pending": pending,
+            "warming": warming,
+            "queued": queued
+        }
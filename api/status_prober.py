@@ -0,0 +1,58 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+from typing import List
+
+
+class StatusProber:
+    """
+    Pings servers concurrently and caches the results for ttl seconds.
+
+    A probe that doesn't answer within timeout doesn't hold up the others: the server keeps its last known
+    stats marked as stale and the probe's result is picked up by a later call once it finished.
+    """
+
+    def __init__(self, ttl: float = 5, timeout: float = 2, max_workers: int = 16):
+        self.ttl = ttl
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="status-probe")
+        self._cache = {}
+        self._pending = {}
+        self._lock = Lock()
+
+    def probe(self, servers: List["MinecraftServer"]):
+        """
+        Refresh online_stats of all given servers
+        """
+        now = time.monotonic()
+        futures = {}
+        with self._lock:
+            for server in servers:
+                if server.get_status() != "running":
+                    self._cache.pop(server.id, None)
+                    server.online_stats = {}
+                    continue
+                cached = self._cache.get(server.id)
+                if cached is not None and now - cached[0] < self.ttl:
+                    server.online_stats = cached[1]
+                    continue
+                future = self._pending.get(server.id)
+                if future is None:
+                    future = self._executor.submit(server.get_server_stats)
+                    self._pending[server.id] = future
+                futures[server.id] = (server, future)
+        if futures:
+            wait([future for _, future in futures.values()], timeout=self.timeout)
+        with self._lock:
+            for server_id, (server, future) in futures.items():
+                if future.done():
+                    self._pending.pop(server_id, None)
+                    try:
+                        stats = future.result()
+                    except Exception:
+                        stats = {}
+                    self._cache[server_id] = (time.monotonic(), stats)
+                    server.online_stats = stats
+                else:
+                    cached = self._cache.get(server_id)
+                    server.online_stats = dict(cached[1] if cached is not None else {}, stale=True)
@@ -0,0 +1,106 @@
+import asyncio
+import functools
+import hmac
+import json
+import os
+from typing import Optional, Iterator
+
+from api.server_manager import ServerManager
+from api.supervisor_protocol import METHODS, encode_message, encode_error
+
+
+class Supervisor:
+    """
+    Owns the ServerManager, and with it all server processes, for any number of API workers.
+
+    Workers connect to a unix socket and send one JSON request per line:
+    {"method": "<ServerManager method>", "params": {...}}. Each request is answered with
+    {"result": ...} or {"error": "..."} on the same connection. The "subscribe" method turns the connection
+    into a stream of datastream frames of one server instead.
+
+    Node agents serve the same protocol over TCP instead, there every request has to carry the shared token.
+    Serving over TCP without a token is refused.
+    """
+
+    def __init__(self, server_manager: ServerManager, socket_path: Optional[str] = None, host: Optional[str] = None,
+                 port: Optional[int] = None, token: Optional[str] = None):
+        self.server_manager = server_manager
+        self.socket_path = socket_path
+        self.host = host
+        self.port = port
+        self.token = token
+        if socket_path is None and not token:
+            raise ValueError("The supervisor needs a token to serve over TCP, set fleet.token in the config")
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    method = request["method"]
+                    params = request.get("params", {})
+                except (ValueError, KeyError, TypeError):
+                    writer.write(encode_message({"error": "Malformed request"}))
+                    await writer.drain()
+                    continue
+                if self.token and not hmac.compare_digest(str(request.get("token", "")).encode(),
+                                                          self.token.encode()):
+                    writer.write(encode_message({"error": "Invalid token"}))
+                    await writer.drain()
+                    break
+                if method == "subscribe":
+                    await self._stream(writer, **params)
+                    break
+                if method not in METHODS:
+                    response = {"error": f"Unknown method {method}"}
+                else:
+                    try:
+                        result = await loop.run_in_executor(
+                            None, functools.partial(self._call, method, params))
+                        response = {"result": result}
+                    except Exception as e:
+                        response = encode_error(e)
+                writer.write(encode_message(response))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _call(self, method: str, params: dict):
+        result = getattr(self.server_manager, method)(**params)
+        if isinstance(result, Iterator):
+            # generators can't be streamed over a request, collect them
+            result = list(result)
+        return result
+
+    async def _stream(self, writer: asyncio.StreamWriter, server_id: int, offset: int = None):
+        frames = self.server_manager.subscribe(server_id, offset)
+        try:
+            async for frame in frames:
+                writer.write(encode_message(frame))
+                await writer.drain()
+        finally:
+            await frames.aclose()
+
+    async def serve(self):
+        if self.socket_path is not None:
+            directory = os.path.dirname(self.socket_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            server = await asyncio.start_unix_server(self._handle_connection, self.socket_path)
+            print(f"Supervisor listening on {self.socket_path}")
+        else:
+            server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+            print(f"Supervisor listening on {self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        asyncio.run(self.serve())
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import socket
+from typing import Optional, AsyncIterator, Union, Tuple
+
+from api.supervisor_protocol import METHODS, ERROR_TYPES, encode_message
+
+
+class SupervisorError(Exception):
+    pass
+
+
+class SupervisorClient:
+    """
+    Stands in for ServerManager in API workers and forwards every call to the supervisor, see Supervisor.
+
+    The supervisor is reached through a unix socket path or, for node agents, a (host, port) tuple.
+    """
+
+    def __init__(self, address: Union[str, Tuple[str, int]], token: Optional[str] = None, timeout: float = 30):
+        self.address = address
+        self.token = token
+        self.timeout = timeout
+
+    def _encode_request(self, method: str, params: dict) -> bytes:
+        request = {"method": method, "params": params}
+        if self.token:
+            request["token"] = self.token
+        return encode_message(request)
+
+    def _connect(self) -> socket.socket:
+        if isinstance(self.address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.address)
+            return sock
+        return socket.create_connection(tuple(self.address), timeout=self.timeout)
+
+    def call(self, method: str, **params):
+        with self._connect() as sock:
+            sock.sendall(self._encode_request(method, params))
+            with sock.makefile("rb") as f:
+                line = f.readline()
+        if not line:
+            raise SupervisorError("Supervisor closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise ERROR_TYPES.get(response.get("error_type"), SupervisorError)(response["error"])
+        return response["result"]
+
+    def __getattr__(self, method: str):
+        if method not in METHODS:
+            raise AttributeError(method)
+
+        def call(*args, **kwargs):
+            if args:
+                raise TypeError("Supervisor calls only take keyword arguments")
+            return self.call(method, **kwargs)
+        return call
+
+    async def subscribe(self, server_id: int, offset: Optional[int] = None) -> AsyncIterator[dict]:
+        limit = 16 * 1024 * 1024
+        if isinstance(self.address, str):
+            reader, writer = await asyncio.open_unix_connection(self.address, limit=limit)
+        else:
+            reader, writer = await asyncio.open_connection(*self.address, limit=limit)
+        try:
+            writer.write(self._encode_request("subscribe", {"server_id": server_id, "offset": offset}))
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                yield json.loads(line)
+        finally:
+            writer.close()
@@ -0,0 +1,63 @@
+import dataclasses
+import json
+from datetime import datetime
+
+# ServerManager methods API workers may call through the supervisor
+METHODS = {
+    "get_available_versions",
+    "create_server",
+    "get_all_server_data",
+    "get_server_data",
+    "start_server",
+    "stop_server",
+    "player_command",
+    "perform_action",
+    "run_actions",
+    "get_start_queue",
+    "set_hibernation",
+    "set_hardware_config",
+    "get_jvm_profiles",
+    "create_backup",
+    "get_backups",
+    "restore_backup",
+    "get_players",
+    "get_server_metrics",
+    "get_server_logs",
+    "search_server_logs",
+    "get_jars",
+    "prewarm_jars",
+    "evict_unused_jars",
+    "get_jobs",
+    "get_job",
+    "get_capacity",
+}
+
+# exceptions that are raised again as themselves by the client, the API answers ValueErrors with a 400
+ERROR_TYPES = {
+    "ValueError": ValueError
+}
+
+
+def encode_error(e: Exception) -> dict:
+    """
+    Encode an exception raised by a ServerManager method, see ERROR_TYPES
+    """
+    for name, error_type in ERROR_TYPES.items():
+        if isinstance(e, error_type):
+            return {"error": str(e), "error_type": name}
+    return {"error": f"{type(e).__name__}: {e}"}
+
+
+def _json_default(obj):
+    if dataclasses.is_dataclass(obj):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return str(obj)
+
+
+def encode_message(message: dict) -> bytes:
+    """
+    Encode a message of the supervisor protocol: one JSON object per line
+    """
+    return json.dumps(message, default=_json_default).encode() + b"\n"
@@ -0,0 +1,76 @@
+import time
+from collections import deque
+from threading import Lock
+from typing import Optional
+
+
+class TickHealth:
+    """
+    Tick lag statistics of one server, built from its "Can't keep up!" console lines.
+
+    Keeps lifetime totals and a sliding window of recent lag events. record() returns an alert once the server
+    was a single time more than alert_ms behind or lagged alert_events times within the window, at most once
+    per cooldown seconds.
+    """
+
+    def __init__(self, window: float = 60, alert_ms: int = 2000, alert_events: int = 5, cooldown: float = 300):
+        self.window = window
+        self.alert_ms = alert_ms
+        self.alert_events = alert_events
+        self.cooldown = cooldown
+        self.total_events = 0
+        self.total_ticks_skipped = 0
+        self.total_ms_behind = 0
+        self.max_ms_behind = 0
+        self.last_event = None
+        self._recent = deque()
+        self._last_alert = None
+        self._lock = Lock()
+
+    def _expire(self, now: float):
+        while self._recent and now - self._recent[0][0] > self.window:
+            self._recent.popleft()
+
+    def record(self, ms_behind: int, ticks_behind: int, now: Optional[float] = None) -> Optional[dict]:
+        """
+        Record a lag event
+        :return: alert data if a threshold was exceeded, else None
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self.total_events += 1
+            self.total_ticks_skipped += ticks_behind
+            self.total_ms_behind += ms_behind
+            self.max_ms_behind = max(self.max_ms_behind, ms_behind)
+            self.last_event = now
+            self._recent.append((now, ms_behind, ticks_behind))
+            self._expire(now)
+            reason = None
+            if ms_behind >= self.alert_ms:
+                reason = f"{ms_behind}ms behind"
+            elif len(self._recent) >= self.alert_events:
+                reason = f"{len(self._recent)} lag events in {self.window:g}s"
+            if reason is None or (self._last_alert is not None and now - self._last_alert < self.cooldown):
+                return None
+            self._last_alert = now
+        return {
+            "reason": reason,
+            **self.snapshot(now)
+        }
+
+    def snapshot(self, now: Optional[float] = None) -> dict:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(now)
+            recent_ms = sum(event[1] for event in self._recent)
+            recent_ticks = sum(event[2] for event in self._recent)
+            return {
+                "events_per_minute": round(len(self._recent) * 60 / self.window, 2),
+                "recent_ms_behind": recent_ms,
+                "recent_ticks_skipped": recent_ticks,
+                "total_events": self.total_events,
+                "total_ticks_skipped": self.total_ticks_skipped,
+                "total_ms_behind": self.total_ms_behind,
+                "max_ms_behind": self.max_ms_behind,
+                "last_event": self.last_event
+            }
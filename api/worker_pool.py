@@ -0,0 +1,30 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _started() -> bool:
+    return True
+
+
+def start_worker_pool(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Create the process pool log searches and backups run in, has to be called before any thread is
+    started. On Linux the workers are forked, a fork only copies the calling thread and locks held by other
+    threads would stay locked in the workers forever.
+    :param workers: number of worker processes, None for one per core
+    :return: the pool, the existing one if it was started already
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(workers)
+        # forked workers are all started with the first task, do that while this is the only thread
+        _pool.submit(_started).result()
+    return _pool
+
+
+def get_worker_pool() -> ProcessPoolExecutor:
+    if _pool is None:
+        raise RuntimeError("The worker pool wasn't started, call start_worker_pool first")
+    return _pool
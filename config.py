@@ -6,11 +6,15 @@ config = {}
 
 def load_config():
     global config
+    config = get_default_config()
     if os.path.isfile("config.json"):
         with open("config.json", "r") as f:
-            config = json.load(f)
-    else:
-        config = get_default_config()
+            loaded = json.load(f)
+        for section, values in loaded.items():
+            if isinstance(values, dict) and isinstance(config.get(section), dict):
+                config[section].update(values)
+            else:
+                config[section] = values
 
 
 def get_config():
@@ -23,7 +27,110 @@ def get_default_config():
             "path": "bukkit",
         },
         "servers": {
-            "path": "data"
+            "path": "data",
+            "process_backend": "thread",
+            "save_delay": 1
+        },
+        "supervisor": {
+            "enabled": False,
+            "socket": "data/supervisor.sock",
+            "api_workers": 2
+        },
+        "fleet": {
+            "role": "standalone",
+            "token": "",
+            "node_id": "",
+            "node_timeout": 30,
+            "coordinator_url": "http://127.0.0.1:5000",
+            "agent_host": "127.0.0.1",
+            "agent_port": 5001,
+            "advertise_host": "127.0.0.1",
+            "heartbeat": 10
+        },
+        "versions": {
+            "cache_file": "data/versions.json",
+            "ttl": 24 * 60 * 60,
+            # seconds to wait for mcversions.net
+            "timeout": 30
+        },
+        "jars": {
+            "path": "data/jars"
+        },
+        "scheduler": {
+            "max_warmups": 2,
+            "memory_reserve": 512,
+            "retry_interval": 5,
+            "warmup_timeout": 300
+        },
+        "jvm": {
+            "java": "java",
+            "large_pages": False,
+            "profiles": {}
+        },
+        "backups": {
+            "path": "data/backups",
+            "compress_level": 6,
+            "keep_last": 10,
+            "keep_daily": 7,
+            "keep_weekly": 4,
+            "save_timeout": 60
+        },
+        "cgroups": {
+            "enabled": False,
+            "path": "/sys/fs/cgroup/mc-server-manager",
+            "memory_overhead": 0.5,
+            # MB, the least memory a server without a memory limit may use beyond its heap
+            "min_overhead": 512
+        },
+        "placement": {
+            "enabled": False
+        },
+        "hibernation": {
+            "check_interval": 30,
+            "host": ""
+        },
+        "actions": {
+            "workers": 8
+        },
+        "jobs": {
+            "workers": 4,
+            "per_host": 2,
+            "history": 100
+        },
+        "logs": {
+            "buffer_size": 4 * 1024 * 1024,
+            "segment_size": 16 * 1024 * 1024,
+            "index_interval": 1000,
+            "compress": True,
+            "max_segments": 64
+        },
+        "pool": {
+            # worker processes for log searches and backups, None for one per core
+            "workers": None
+        },
+        "datastream": {
+            "send_timeout": 5
+        },
+        "status": {
+            "ttl": 5,
+            "timeout": 2,
+            "workers": 16
+        },
+        "rcon": {
+            "pool_size": 2,
+            "timeout": 5
+        },
+        "tick_health": {
+            "window": 60,
+            "alert_ms": 2000,
+            "alert_events": 5,
+            "cooldown": 300
+        },
+        "monitoring": {
+            "interval": 3,
+            "jitter": 0.5,
+            "uss": False,
+            "history_tiers": [[1, 600], [60, 1440]]
         }
     }
 
@@ -6,7 +6,7 @@ from fastapi.middleware.cors import CORSMiddleware
 
 import uvicorn
 from starlette.staticfiles import StaticFiles
-from config import load_config
+from config import load_config, get_config
 load_config()
 
 from api import api
@@ -23,6 +23,9 @@ app.add_middleware(
 
 app.include_router(api.router)
 app.include_router(api.server_router)
+app.include_router(api.jar_router)
+app.include_router(api.job_router)
+app.include_router(api.node_router)
 
 app.mount("/static", StaticFiles(directory="web/static"), name="static")
 
@@ -37,5 +40,11 @@ async def root():
 
 if __name__ == '__main__':
     webbrowser.open('localhost:5000')
-    uvicorn.run("main:app", host="0.0.0.0", workers=2, port=5000, reload=True)
+    supervisor_config = get_config()["supervisor"]
+    if supervisor_config["enabled"]:
+        # servers are owned by supervisor.py, so API workers share no state and can be scaled out
+        uvicorn.run("main:app", host="0.0.0.0", workers=supervisor_config["api_workers"], port=5000)
+    else:
+        # every worker would start its own ServerManager, only run one
+        uvicorn.run("main:app", host="0.0.0.0", workers=1, port=5000, reload=True)
 
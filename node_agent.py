@@ -0,0 +1,44 @@
+import socket
+import time
+from threading import Thread
+
+import requests
+
+from config import load_config, get_config
+load_config()
+
+from api.minecraft_server_versions import AvailableMinecraftServerVersions
+from api.server_manager import ServerManager
+from api.supervisor import Supervisor
+from api.worker_pool import start_worker_pool
+
+
+def heartbeat(server_manager: ServerManager):
+    """
+    Register this node with the coordinator and keep its capacity up to date
+    """
+    config = get_config()["fleet"]
+    node_id = config["node_id"] or socket.gethostname()
+    while True:
+        try:
+            requests.post(f"{config['coordinator_url']}/api/nodes/register", json={
+                "node_id": node_id,
+                "host": config["advertise_host"],
+                "port": config["agent_port"],
+                "capacity": server_manager.get_capacity()
+            }, headers={"Authorization": f"Bearer {config['token']}"}, timeout=10).raise_for_status()
+        except requests.RequestException as e:
+            print(f"Failed to register with coordinator: {e}")
+        time.sleep(config["heartbeat"])
+
+
+if __name__ == '__main__':
+    fleet_config = get_config()["fleet"]
+    if not fleet_config["token"]:
+        raise SystemExit("Node agents accept commands over the network, set fleet.token in the config first")
+    start_worker_pool(get_config()["pool"]["workers"])
+    server_manager = ServerManager(AvailableMinecraftServerVersions())
+    supervisor = Supervisor(server_manager, host=fleet_config["agent_host"], port=fleet_config["agent_port"],
+                            token=fleet_config["token"])
+    Thread(target=heartbeat, args=[server_manager], daemon=True).start()
+    supervisor.run()
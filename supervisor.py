@@ -0,0 +1,13 @@
+from config import load_config, get_config
+load_config()
+
+from api.minecraft_server_versions import AvailableMinecraftServerVersions
+from api.server_manager import ServerManager
+from api.supervisor import Supervisor
+from api.worker_pool import start_worker_pool
+
+
+if __name__ == '__main__':
+    start_worker_pool(get_config()["pool"]["workers"])
+    server_manager = ServerManager(AvailableMinecraftServerVersions())
+    Supervisor(server_manager, get_config()["supervisor"]["socket"]).run()
@@ -0,0 +1,61 @@
+import unittest
+
+from api.console_parser import ConsoleParser
+
+
+class ConsoleParserTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = ConsoleParser()
+
+    def assertEvent(self, line: str, event_type: str, **data):
+        event = self.parser.parse(line)
+        self.assertIsNotNone(event, line)
+        self.assertEqual(event.type, event_type)
+        self.assertEqual(event.data, data)
+
+    def test_events(self):
+        self.assertEvent("[12:00:00] [Server thread/INFO]: Starting minecraft server version 1.18.1", "starting",
+                         version="1.18.1")
+        self.assertEvent('[12:00:05] [Server thread/INFO]: Done (4.21s)! For help, type "help"', "done",
+                         startup_time="4.21")
+        self.assertEvent('[12:00:05] [Server thread/INFO]: Done (4.21s)! For help, type "help" or "?"', "done",
+                         startup_time="4.21")
+        self.assertEvent("[12:01:00] [Server thread/INFO]: Dummerle123 joined the game", "player_join",
+                         player="Dummerle123")
+        self.assertEvent("[12:02:00] [Server thread/INFO]: Dummerle123 left the game", "player_leave",
+                         player="Dummerle123")
+        self.assertEvent("[12:03:00] [Server thread/WARN]: Can't keep up! Is the server overloaded? Running 2345ms "
+                         "or 46 ticks behind", "cant_keep_up", ms_behind="2345", ticks_behind="46")
+        self.assertEvent("[12:04:00] [Server thread/INFO]: Saved the game", "saved")
+        self.assertEvent("[12:05:00] [Server thread/INFO]: Stopping the server", "stopping")
+        self.assertEvent("[12:05:00] [Server thread/INFO]: Stopping server", "stopping")
+        self.assertEvent("[12:06:00] [Server thread/ERROR]: Encountered an unexpected exception", "crash")
+
+    def test_paper_prefix(self):
+        self.assertEvent('[12:00:05 INFO]: Done (4.21s)! For help, type "help"', "done", startup_time="4.21")
+        self.assertEvent("[12:05:00 INFO]: Stopping the server", "stopping")
+
+    def test_chat_is_no_event(self):
+        for message in [
+            "<Bob> ]: Stopping the server",
+            '<Bob> ]: Done (1.0s)! For help, type "help"',
+            "<Bob> ]: Saved the game",
+            "<Bob> Alice joined the game",
+            "<Bob> Can't keep up! Running 99999ms or 2000 ticks behind",
+            "<Bob> Encountered an unexpected exception",
+            "[Bob] Stopping the server",
+            "* Bob Saved the game"
+        ]:
+            for prefix in ["[12:00:00] [Server thread/INFO]: ", "[12:00:00] [Async Chat Thread - #0/INFO]: ",
+                           "[12:00:00 INFO]: "]:
+                line = prefix + message
+                self.assertIsNone(self.parser.parse(line), line)
+
+    def test_other_lines(self):
+        self.assertIsNone(self.parser.parse("[12:00:00] [Server thread/INFO]: Preparing level \"world\""))
+        self.assertIsNone(self.parser.parse("Saved the game"))
+
+
+if __name__ == '__main__':
+    unittest.main()
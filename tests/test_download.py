@@ -0,0 +1,141 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+
+from api.download import download_file, DownloadProgress
+from api.jar_store import JarStore
+
+PAYLOAD = bytes(range(256)) * 4096
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+
+    def do_GET(self):
+        self.server.ranges.append(self.headers.get("Range"))
+        offset = 0
+        range_header = self.headers.get("Range")
+        if range_header is not None and self.server.supports_range:
+            offset = int(range_header[len("bytes="):].rstrip("-"))
+            if offset >= len(PAYLOAD):
+                self.send_response(416)
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {offset}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+        body = PAYLOAD[offset:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.server.drop_after:
+            # send part of the body and close the connection, as if it broke
+            self.wfile.write(body[:self.server.drop_after])
+            self.server.drop_after = 0
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.ranges = []
+        self.supports_range = True
+        self.drop_after = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/server.jar"
+
+
+class _ServerVersions:
+
+    def __init__(self, url: str, sha1: str):
+        self.info = {"url": url, "sha1": sha1}
+
+    def get_download_info(self, version: str) -> dict:
+        return self.info
+
+
+class DownloadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _Server()
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.path = tempfile.mkdtemp()
+        self.destination = os.path.join(self.path, "server.jar")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.path)
+
+    def _read(self, path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_download(self):
+        progress = DownloadProgress()
+        download_file(self.server.url, self.destination, progress)
+        self.assertEqual(self._read(self.destination), PAYLOAD)
+        self.assertEqual(progress.downloaded, len(PAYLOAD))
+        self.assertEqual(progress.total, len(PAYLOAD))
+        self.assertEqual(self.server.ranges, [None])
+
+    def test_resume_partial_file(self):
+        with open(f"{self.destination}.part", "wb") as f:
+            f.write(PAYLOAD[:1000])
+        progress = DownloadProgress()
+        download_file(self.server.url, self.destination, progress)
+        self.assertEqual(self.server.ranges, ["bytes=1000-"])
+        self.assertEqual(self._read(self.destination), PAYLOAD)
+        self.assertEqual(progress.total, len(PAYLOAD))
+        self.assertFalse(os.path.exists(f"{self.destination}.part"))
+
+    def test_resume_after_connection_drop(self):
+        self.server.drop_after = 64 * 4096
+        download_file(self.server.url, self.destination, chunk_size=4096)
+        self.assertEqual(self.server.ranges, [None, f"bytes={64 * 4096}-"])
+        self.assertEqual(self._read(self.destination), PAYLOAD)
+
+    def test_complete_part_file(self):
+        with open(f"{self.destination}.part", "wb") as f:
+            f.write(PAYLOAD)
+        download_file(self.server.url, self.destination)
+        self.assertEqual(self.server.ranges, [f"bytes={len(PAYLOAD)}-"])
+        self.assertEqual(self._read(self.destination), PAYLOAD)
+
+    def test_restart_without_range_support(self):
+        self.server.supports_range = False
+        with open(f"{self.destination}.part", "wb") as f:
+            f.write(b"x" * 1000)
+        download_file(self.server.url, self.destination)
+        self.assertEqual(self._read(self.destination), PAYLOAD)
+
+    def test_jar_store_checksum(self):
+        sha1 = hashlib.sha1(PAYLOAD).hexdigest()
+        store = JarStore(_ServerVersions(self.server.url, sha1), os.path.join(self.path, "jars"))
+        jar_path = store.ensure("1.18.1")
+        self.assertEqual(os.path.basename(jar_path), f"{sha1}.jar")
+        self.assertEqual(self._read(jar_path), PAYLOAD)
+
+    def test_jar_store_checksum_mismatch(self):
+        store = JarStore(_ServerVersions(self.server.url, "0" * 40), os.path.join(self.path, "jars"))
+        with self.assertRaises(ValueError):
+            store.ensure("1.18.1")
+        self.assertIsNone(store.get("1.18.1"))
+        self.assertEqual(os.listdir(os.path.join(self.path, "jars", "1.18.1")), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from api.log_search import compile_query, search_segment, _search_buffer
+
+
+class LogSearchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_plain_text(self):
+        pattern = compile_query("a.b")
+        self.assertEqual(_search_buffer(b"axb\na.b\n", pattern, 10, 10), [(11, "a.b")])
+
+    def test_regex_per_line(self):
+        pattern = compile_query("^ba", regex=True)
+        self.assertEqual(_search_buffer(b"foo\nbar\nbaz\n", pattern, 0, 10), [(1, "bar"), (2, "baz")])
+        pattern = compile_query("o$", regex=True)
+        self.assertEqual(_search_buffer(b"foo\nbar\nbaz\n", pattern, 0, 10), [(0, "foo")])
+
+    def test_ignore_case(self):
+        pattern = compile_query("FOO", ignore_case=True)
+        self.assertEqual(_search_buffer(b"foo\nbar\n", pattern, 0, 10), [(0, "foo")])
+
+    def test_empty_matches(self):
+        for query, regex in [("", False), ("^", True), (".*", True), ("$", True)]:
+            pattern = compile_query(query, regex)
+            self.assertEqual(_search_buffer(b"foo\nbar\nbaz\n", pattern, 0, 10), [(0, "foo"), (1, "bar"), (2, "baz")],
+                             query)
+            self.assertEqual(_search_buffer(b"foo\nbar", pattern, 0, 10), [(0, "foo"), (1, "bar")], query)
+            self.assertEqual(_search_buffer(b"", pattern, 0, 10), [], query)
+
+    def test_limit(self):
+        pattern = compile_query("line")
+        self.assertEqual(len(_search_buffer(b"line\n" * 100, pattern, 0, 10)), 10)
+
+    def test_search_segment(self):
+        path = os.path.join(self.path, "segment-000000000100.log")
+        with open(path, "wb") as f:
+            f.write(b"[12:00:00] [Server thread/INFO]: Dummerle123 joined the game\n"
+                    b"[12:00:01] [Server thread/INFO]: <Dummerle123> hi\n")
+        pattern = compile_query("joined")
+        expected = [(100, "[12:00:00] [Server thread/INFO]: Dummerle123 joined the game")]
+        self.assertEqual(search_segment(path, 100, pattern, 10), expected)
+        # compressed after the search was started
+        with open(path, "rb") as src, gzip.open(f"{path}.gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+        self.assertEqual(search_segment(path, 100, pattern, 10), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()